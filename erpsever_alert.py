@@ -0,0 +1,48 @@
+import argparse
+import os
+from erpsever_core import FETCH_BACKEND, AlertService, SeleniumBackend, run_service
+
+def main():
+    parser = argparse.ArgumentParser(description="Alert on planned power interruptions over any mix of channels")
+    parser.add_argument("--municipality", default=os.getenv("MUNICIPALITY"), help="Area to watch, e.g. Добрич")
+    parser.add_argument("--target", default=os.getenv("TARGET_TEXT"), help="Street, village or business customer to look for")
+    parser.add_argument("--email", action="append", default=[], help="Email recipient (repeatable)")
+    parser.add_argument("--twilio", action="append", default=[], help="WhatsApp number sent to through Twilio (repeatable)")
+    parser.add_argument("--pywhatkit", action="append", default=[], help="WhatsApp number sent to through pywhatkit (repeatable)")
+    parser.add_argument("--channel", action="append", default=[], metavar="NAME=RECIPIENT",
+                        help="Recipient on any other channel, including NOTIFIER_PLUGINS ones (repeatable)")
+    parser.add_argument("--backend", choices=("selenium", "http"), default=FETCH_BACKEND)
+    parser.add_argument("--browser-profile", choices=("full", "lean"), default=None,
+                        help="Chrome profile of the selenium backend (default: BROWSER_PROFILE or full)")
+    parser.add_argument("--measure", action="store_true", help="Report bytes received and peak browser memory per check")
+    parser.add_argument("--every", type=int, default=int(os.getenv("CHECK_INTERVAL_MINUTES", "5")), help="Minutes between checks")
+    parser.add_argument("--once", action="store_true", help="Run a single check and exit")
+    args = parser.parse_args()
+
+    if not args.municipality or not args.target:
+        parser.error("--municipality and --target (or MUNICIPALITY and TARGET_TEXT) are required")
+    recipients = {"email": args.email, "twilio": args.twilio, "pywhatkit": args.pywhatkit}
+    for entry in args.channel:
+        channel, recipient = entry.split("=", 1)
+        recipients.setdefault(channel, []).append(recipient)
+    if not any(recipients.values()):
+        parser.error("give at least one recipient, e.g. --email someone@example.com")
+
+    backend = args.backend
+    if backend == "selenium":
+        backend = SeleniumBackend(args.browser_profile, args.measure or None)
+    service = AlertService(args.municipality, args.target, recipients, backend=backend)
+    if args.once:
+        service.backend.prepare()
+        try:
+            service.job()
+            # Deliver what the check queued before exiting
+            for channel in service.recipients:
+                service.dispatcher.drain(channel)
+        finally:
+            service.close()
+        return
+    run_service(service, args.every)
+
+if __name__ == "__main__":
+    main()
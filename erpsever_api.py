@@ -0,0 +1,242 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from erpsever_parse import Interruption, InterruptionIndex
+from erpsever_seen import interruption_key
+
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+API_CSV = os.getenv("API_CSV", "interruption_data.csv")
+# Seconds between checks for new extraction output
+API_RELOAD_SECONDS = float(os.getenv("API_RELOAD_SECONDS", "5"))
+# Rendered responses kept per data version, so repeated queries are not recomputed
+RESPONSE_CACHE_SIZE = 1024
+
+def to_json(interruption, current):
+    def stamp(value):
+        return value.isoformat() if value else None
+
+    return {
+        "area": interruption.area,
+        "period": interruption.period,
+        "text": interruption.text,
+        "starts_at": stamp(interruption.starts_at()),
+        "ends_at": stamp(interruption.ends_at()),
+        "windows": [[start.strftime("%H:%M"), end.strftime("%H:%M")] for start, end in interruption.windows],
+        "published": stamp(interruption.published),
+        "settlements": list(interruption.settlements),
+        "streets": list(interruption.streets),
+        "customers": list(interruption.customers),
+        "current": current,
+    }
+
+class InterruptionStore:
+    # In-memory index over the latest extraction and the history archive, extended in place when
+    # erpsever_extract_all.py writes new output
+
+    def __init__(self, csv_path=API_CSV, archive_path=None):
+        self.csv_path = csv_path
+        self.archive_path = archive_path
+        self.index = InterruptionIndex()
+        self.keys = {}
+        self.current = set()
+        self.version = 0
+        self.loaded_at = None
+        self.csv_stamp = None
+        self.archive_files = set()
+        self.lock = threading.RLock()
+        self.responses = OrderedDict()
+
+    def add_rows(self, rows):
+        # Index rows not seen before; returns the indexed interruptions of all given rows
+        interruptions = set()
+        for area, period, text in rows:
+            key = interruption_key(area, period, text)
+            interruption = self.keys.get(key)
+            if interruption is None:
+                interruption = Interruption(area, period, text)
+                self.index.add(interruption)
+                self.keys[key] = interruption
+            interruptions.add(interruption)
+        return interruptions
+
+    def reload(self):
+        # Pick up a rewritten CSV and new archive files; returns True when anything changed
+        changed = False
+        with self.lock:
+            if os.path.exists(self.csv_path):
+                stat = os.stat(self.csv_path)
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                if stamp != self.csv_stamp:
+                    with open(self.csv_path, newline='', encoding='utf-8') as file:
+                        rows = [(row['Area'], row['Period'], row['Text']) for row in csv.DictReader(file)]
+                    before = len(self.index.interruptions)
+                    current = self.add_rows(rows)
+                    changed = current != self.current or len(self.index.interruptions) != before
+                    self.current = current
+                    self.csv_stamp = stamp
+            if self.archive_path and os.path.isdir(self.archive_path):
+                from erpsever_archive import HistoryArchive
+                archive = HistoryArchive(self.archive_path)
+                for path in archive.files():
+                    if path in self.archive_files:
+                        continue
+                    table = archive.read_file(path, ["area", "period", "reason", "details"]).to_pydict()
+                    before = len(self.index.interruptions)
+                    self.add_rows(zip(table["area"], table["period"],
+                                      (reason + details for reason, details in zip(table["reason"], table["details"]))))
+                    changed = changed or len(self.index.interruptions) != before
+                    self.archive_files.add(path)
+            if changed:
+                self.version += 1
+                self.loaded_at = time.time()
+                self.responses.clear()
+                print(f"Index version {self.version}: {len(self.index.interruptions)} interruptions, {len(self.current)} current")
+        return changed
+
+    def watch(self, interval=API_RELOAD_SECONDS):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"Failed to reload interruption data: {e}")
+        threading.Thread(target=loop, daemon=True).start()
+
+    def query(self, q=None, area=None, start=None, end=None, current_only=False):
+        with self.lock:
+            if q:
+                found = self.index.lookup(q, area)
+                if start is not None or end is not None:
+                    found = [interruption for interruption in found if overlaps(interruption, start, end)]
+            elif start is not None or end is not None:
+                found = self.index.between(start or datetime.min, end or datetime.max, area)
+            elif area is not None:
+                found = [self.index.interruptions[position] for position in self.index.by_area.get(area, ())]
+            else:
+                found = list(self.index.interruptions)
+            results = []
+            for interruption in found:
+                current = interruption in self.current
+                if current or not current_only:
+                    results.append(to_json(interruption, current))
+            return results
+
+    def areas(self):
+        with self.lock:
+            return {area: len(positions) for area, positions in sorted(self.index.by_area.items())}
+
+    def cached(self, key, render):
+        # Body for key at the current data version, rendered once
+        with self.lock:
+            key = (self.version, key)
+            body = self.responses.get(key)
+            if body is not None:
+                self.responses.move_to_end(key)
+                return body
+        body = json.dumps(render(), ensure_ascii=False).encode('utf-8')
+        with self.lock:
+            self.responses[key] = body
+            if len(self.responses) > RESPONSE_CACHE_SIZE:
+                self.responses.popitem(last=False)
+        return body
+
+def overlaps(interruption, start, end):
+    start = start or datetime.min
+    end = end or datetime.max
+    if interruption.start is None or interruption.starts_at() > end or interruption.ends_at() < start:
+        return False
+    return any(window_start <= end and window_end >= start for window_start, window_end in interruption.intervals())
+
+def parse_time(value):
+    # "2024-08-05", "2024-08-05T10:00" or "2024-08-05 10:00"; a UTC offset or "Z" (toISOString())
+    # is converted to local time, since the interruption periods are naive local times
+    if not value:
+        return None
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # GET /interruptions?q=Батово&area=Добрич&hours=48 | &from=...&to=... | &current=1
+    # GET /areas, GET /status
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        store = self.server.store
+        try:
+            if url.path == "/interruptions":
+                start, end = parse_time(params.get("from")), parse_time(params.get("to"))
+                relative = "hours" in params
+                if relative:
+                    # Relative windows move with the clock, so they are keyed by the current minute
+                    start = datetime.now().replace(second=0, microsecond=0)
+                    end = start + timedelta(hours=float(params["hours"]))
+                key = (url.path, url.query, start.isoformat() if relative else "")
+                render = lambda: store.query(params.get("q"), params.get("area"), start, end, params.get("current") == "1")
+            elif url.path == "/areas":
+                key, render = (url.path,), store.areas
+            elif url.path == "/status":
+                key = (url.path,)
+                render = lambda: {"version": store.version, "interruptions": len(store.index.interruptions),
+                                  "current": len(store.current), "loaded_at": store.loaded_at}
+            else:
+                self.send_error(404)
+                return
+        except (ValueError, OverflowError) as e:
+            # OverflowError: hours, from or to outside what datetime can hold, e.g. hours=1e20
+            self.send_error(400, str(e))
+            return
+
+        etag = '"{}-{}"'.format(store.version, hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16])
+        if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = store.cached(key, render)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(store, host=API_HOST, port=API_PORT):
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.store = store
+    print(f"Query API listening on http://{host}:{server.server_port}/interruptions")
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP query API over current and archived interruptions")
+    parser.add_argument("--csv", default=API_CSV, help="Output of erpsever_extract_all.py")
+    parser.add_argument("--archive", help="History archive directory to index as well (needs pyarrow)")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    store = InterruptionStore(args.csv, args.archive)
+    store.reload()
+    store.watch()
+    serve(store, args.host, args.port).serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+from datetime import datetime
+import argparse
+import csv
+import os
+import time
+from erpsever_parse import parse_published
+from erpsever_seen import interruption_key
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # The archive is optional, everything else works without pyarrow
+    pa = None
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+# Arrow IPC buffer compression: "zstd", "lz4" or "none"
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+
+# Everything up to this marker is the same few boilerplate sentences on every row
+BOILERPLATE_MARK = "в районите на:"
+UNKNOWN_PARTITION = "published=unknown"
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("The history archive needs pyarrow: pip install pyarrow")
+
+def split_text(text):
+    # "Поради извършване ... в районите на: с. Крумово ..." -> (boilerplate, details); joined back they give text
+    position = text.find(BOILERPLATE_MARK)
+    if position == -1:
+        return "", text
+    position += len(BOILERPLATE_MARK)
+    return text[:position], text[position:]
+
+def dictionary_array(values):
+    # Dictionary-encode a string column: each distinct value is stored once
+    positions = {}
+    indices = [positions.setdefault(value, len(positions)) for value in values]
+    return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int16()), pa.array(list(positions), pa.string()))
+
+def archive_schema():
+    return pa.schema([
+        ("key", pa.string()),
+        ("area", pa.dictionary(pa.int16(), pa.string())),
+        ("period", pa.string()),
+        ("reason", pa.dictionary(pa.int16(), pa.string())),
+        ("details", pa.string()),
+        ("published", pa.timestamp("s")),
+        ("extracted_at", pa.timestamp("s")),
+    ])
+
+def partition_name(published):
+    return f"published={published:%Y-%m-%d}" if published else UNKNOWN_PARTITION
+
+class HistoryArchive:
+    # Append-only Arrow IPC archive of extracted interruptions, partitioned by publication date
+
+    def __init__(self, path=ARCHIVE_DIR, compression=ARCHIVE_COMPRESSION):
+        require_pyarrow()
+        self.path = path
+        self.compression = None if compression == "none" else compression
+        self._keys = None
+
+    def partitions(self, start=None, end=None):
+        # Partition directories, pruned by publication date (start/end are dates)
+        if not os.path.isdir(self.path):
+            return []
+        names = sorted(name for name in os.listdir(self.path) if name.startswith("published="))
+        selected = []
+        for name in names:
+            if name == UNKNOWN_PARTITION:
+                if start is None and end is None:
+                    selected.append(name)
+                continue
+            day = datetime.strptime(name.split("=", 1)[1], "%Y-%m-%d").date()
+            if (start is None or day >= start) and (end is None or day <= end):
+                selected.append(name)
+        return [os.path.join(self.path, name) for name in selected]
+
+    def files(self, start=None, end=None):
+        paths = []
+        for partition in self.partitions(start, end):
+            paths.extend(os.path.join(partition, name) for name in sorted(os.listdir(partition)) if name.endswith(".arrow"))
+        return paths
+
+    def read_file(self, path, columns=None):
+        # Memory-mapped read; only the requested columns are materialized
+        with pa.memory_map(path, "r") as source:
+            table = ipc.open_file(source).read_all()
+        return table.select(columns) if columns else table
+
+    def known_keys(self):
+        if self._keys is None:
+            self._keys = set()
+            for path in self.files():
+                self._keys.update(self.read_file(path, ["key"]).column("key").to_pylist())
+        return self._keys
+
+    def append(self, rows, extracted_at=None):
+        # Add [area, period, text] rows that are not archived yet; returns the number of new rows
+        extracted_at = datetime.fromtimestamp(int(extracted_at or time.time()))
+        known = self.known_keys()
+        by_partition = {}
+        for area, period, text in rows:
+            key = interruption_key(area, period, text)
+            if key in known:
+                continue
+            known.add(key)
+            published = parse_published(text)
+            by_partition.setdefault(partition_name(published), []).append((key, area, period, text, published))
+
+        for partition, records in by_partition.items():
+            self.write_partition(partition, records, extracted_at)
+        return sum(len(records) for records in by_partition.values())
+
+    def write_partition(self, partition, records, extracted_at):
+        reasons, details = zip(*(split_text(text) for _, _, _, text, _ in records))
+        table = pa.Table.from_arrays([
+            pa.array([record[0] for record in records], pa.string()),
+            dictionary_array([record[1] for record in records]),
+            pa.array([record[2] for record in records], pa.string()),
+            dictionary_array(reasons),
+            pa.array(details, pa.string()),
+            pa.array([record[4] for record in records], pa.timestamp("s")),
+            pa.array([extracted_at] * len(records), pa.timestamp("s")),
+        ], schema=archive_schema())
+
+        directory = os.path.join(self.path, partition)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{extracted_at:%Y%m%dT%H%M%S}-{os.getpid()}.arrow")
+        temp_path = path + ".tmp"
+        options = ipc.IpcWriteOptions(compression=self.compression)
+        with pa.OSFile(temp_path, "wb") as sink:
+            with ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, path)
+
+    def read(self, start=None, end=None, area=None):
+        tables = [self.read_file(path) for path in self.files(start, end)]
+        if not tables:
+            return archive_schema().empty_table()
+        table = pa.concat_tables(tables)
+        if area is not None:
+            table = table.filter(pa.array([value == area for value in table.column("area").to_pylist()]))
+        return table
+
+    def rows(self, start=None, end=None, area=None):
+        # [area, period, text] rows in the current CSV layout
+        table = self.read(start, end, area)
+        columns = table.select(["area", "period", "reason", "details"]).to_pydict()
+        return [[area, period, reason + details] for area, period, reason, details
+                in zip(columns["area"], columns["period"], columns["reason"], columns["details"])]
+
+    def export_csv(self, path, start=None, end=None, area=None):
+        rows = self.rows(start, end, area)
+        with open(path, mode='w', newline='', encoding='utf-8') as csv_file:
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(['Area', 'Period', 'Text'])
+            csv_writer.writerows(rows)
+        return len(rows)
+
+def read_csv_rows(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return [[row['Area'], row['Period'], row['Text']] for row in csv.DictReader(file)]
+
+def parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Append-only columnar history of extracted interruptions")
+    parser.add_argument("--archive", default=ARCHIVE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    append = commands.add_parser("append", help="Archive the rows of an Area,Period,Text CSV")
+    append.add_argument("csv", nargs="?", default="interruption_data.csv")
+    export = commands.add_parser("export", help="Write archived rows back to an Area,Period,Text CSV")
+    export.add_argument("csv")
+    export.add_argument("--area")
+    for command in (export, commands.add_parser("stats", help="Show the archive size per partition")):
+        command.add_argument("--from", dest="start", help="First publication date (YYYY-MM-DD)")
+        command.add_argument("--to", dest="end", help="Last publication date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    archive = HistoryArchive(args.archive)
+    if args.command == "append":
+        added = archive.append(read_csv_rows(args.csv))
+        print(f"Archived {added} new interruptions from {args.csv}")
+    elif args.command == "export":
+        written = archive.export_csv(args.csv, parse_day(args.start), parse_day(args.end), args.area)
+        print(f"Exported {written} interruptions to {args.csv}")
+    else:
+        for partition in archive.partitions(parse_day(args.start), parse_day(args.end)):
+            files = [os.path.join(partition, name) for name in os.listdir(partition) if name.endswith(".arrow")]
+            size = sum(os.path.getsize(path) for path in files)
+            rows = sum(archive.read_file(path, ["key"]).num_rows for path in files)
+            print(f"{os.path.basename(partition)}: {rows} rows in {len(files)} files, {size / 1024:.1f} KB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import csv
+import html
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import erpsever_http
+from erpsever_parse import DATE_RE, parse_locations
+
+# Subscriber counts and outage-row multipliers benchmarked by default
+DEFAULT_SUBSCRIBERS = "10,1000,100000"
+DEFAULT_ROW_SCALES = "1,10"
+# Share of subscribers whose target occurs in their area's interruptions
+DEFAULT_MATCH_RATIO = 0.1
+
+# The parts of the live page the alert scripts look at; clicking an area loads its list like the real widget
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Планирани прекъсвания</title></head>
+<body><div class="table site-table"><main>
+<section></section>
+<section><div class="wrapper">
+<div class="map-interruptions"><div class="sidebar"><div class="areas">{items}</div></div></div>
+<div class="interruption-data"><ul id="interruption_areas"></ul></div>
+</div></section>
+</main></div>
+<script>
+document.querySelectorAll('div.areas div.item').forEach(function (item) {{
+    item.addEventListener('click', function () {{
+        fetch('/area?name=' + encodeURIComponent(item.dataset.area))
+            .then(function (response) {{ return response.text(); }})
+            .then(function (markup) {{ document.querySelector('div.interruption-data').outerHTML = markup; }});
+    }});
+}});
+</script></body></html>
+"""
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    # Serves the saved page at / and one area's ul#interruption_areas at /area?name=...
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        pages = self.server.pages
+        if url.path == "/":
+            body = pages["_index"]
+        elif url.path == "/area":
+            body = pages.get(parse_qs(url.query).get("name", [""])[0])
+        else:
+            body = None
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), ReplayHandler)
+    server.pages = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def load_rows(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return [[row['Area'], row['Period'], row['Text']] for row in csv.DictReader(file)]
+
+def scale_rows(rows, scale):
+    # Copies of every row with their periods moved to the coming days, so none of them has expired;
+    # each copy gets its own text, so they count as different interruptions
+    starts = [date(int(y), int(m), int(d)) for _, period, _ in rows for d, m, y in DATE_RE.findall(period)[:1]]
+    offset = date.today() + timedelta(days=1) - min(starts) if starts else timedelta(0)
+
+    def shift(match):
+        day = date(int(match.group(3)), int(match.group(2)), int(match.group(1))) + offset
+        return f"{day:%d.%m.%Y}"
+
+    scaled = []
+    for copy in range(scale):
+        for area, period, text in rows:
+            scaled.append([area, DATE_RE.sub(shift, period), text if copy == 0 else f"{text} ({copy})"])
+    return scaled
+
+def build_pages(rows):
+    by_area = {}
+    for area, period, text in rows:
+        by_area.setdefault(area, []).append((period, text))
+    pages = {area: erpsever_http.render_area_html(area_rows) for area, area_rows in by_area.items()}
+    items = "".join(f'<div class="item" data-area="{html.escape(area)}"><strong>{html.escape(area)}</strong></div>'
+                    for area in by_area)
+    pages["_index"] = PAGE_TEMPLATE.format(items=items)
+    return pages
+
+def write_subscribers(path, rows, count, match_ratio, seed=1):
+    # count synthetic subscribers spread over the areas; match_ratio of them watch a settlement that is listed
+    settlements = {}
+    for area, _, text in rows:
+        settlements.setdefault(area, set()).update(parse_locations(text)[0])
+    areas = sorted(settlements)
+    channels = ("email", "twilio", "pywhatkit")
+    generator = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Channel', 'Area', 'Target', 'Recipient'])
+        for number in range(count):
+            area = areas[number % len(areas)]
+            names = sorted(settlements[area])
+            if names and generator.random() < match_ratio:
+                target = generator.choice(names)
+            else:
+                target = f"Несъществуващо{number}"
+            writer.writerow([channels[number % 3], area, target, f"subscriber{number}@example.com"])
+
+class StageTimer:
+    # Latency samples per pipeline stage
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - started)
+        return timed
+
+    def summary(self):
+        return {name: percentiles(samples) for name, samples in self.samples.items()}
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def rank(share):
+        return ordered[min(len(ordered) - 1, int(share * len(ordered)))] * 1000
+
+    return {"count": len(ordered), "p50_ms": rank(0.5), "p90_ms": rank(0.9), "p99_ms": rank(0.99),
+            "max_ms": ordered[-1] * 1000, "total_ms": sum(ordered) * 1000}
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def stub_send(recipient, body):
+    pass
+
+def run_fanout(subscribers_file, rows, cycles, workdir):
+    # Full fan-out cycles over the HTTP backend; runs in its own process so its peak RSS is its own
+    import erpsever_fanout
+    from erpsever_dispatch import Dispatcher, FunctionChannel
+
+    os.chdir(workdir)
+    started_rss = peak_rss_mb()
+    stages = StageTimer()
+    erpsever_http.fetch = stages.wrap("fetch", erpsever_http.fetch)
+    erpsever_http.parse_response = stages.wrap("parse", erpsever_http.parse_response)
+    erpsever_fanout.build_matchers = stages.wrap("build matchers", erpsever_fanout.build_matchers)
+
+    service = erpsever_fanout.FanoutService(subscribers_file, backend="http")
+    match = service.match
+    service.match = stages.wrap("match", lambda events: list(match(events)))
+    # Senders are stubbed; what is measured is queueing, claiming and bookkeeping
+    service.dispatcher = Dispatcher({channel: FunctionChannel(stub_send, per_second=1e9)
+                                     for channel in erpsever_fanout.CHANNELS}, "dispatch_queue.db")
+    service.dispatcher.enqueue_many = stages.wrap("enqueue", service.dispatcher.enqueue_many)
+    service.reminders.follow_many = stages.wrap("reminders", service.reminders.follow_many)
+
+    delivered = 0
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for _ in range(cycles):
+            # Every cycle starts cold: nothing fingerprinted and nothing seen
+            service.fingerprints.reset()
+            service.seen.expiry.clear()
+            service.snapshots.clear()
+            with service.seen.connection:
+                service.seen.connection.execute("DELETE FROM seen")
+            stages.wrap("cycle", service.run_cycle)()
+            started = time.perf_counter()
+            delivered += sum(service.dispatcher.drain(channel) for channel in erpsever_fanout.CHANNELS)
+            stages.record("deliver", time.perf_counter() - started)
+    service.close()
+
+    summary = stages.summary()
+    cycle_seconds = summary["cycle"]["p50_ms"] / 1000
+    deliver_seconds = summary["deliver"]["total_ms"] / 1000
+    return {
+        "stages": summary,
+        "notifications_per_cycle": delivered // cycles,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "baseline_rss_mb": round(started_rss, 1),
+        "throughput": {
+            "interruptions_per_s": round(len(rows) / cycle_seconds, 1) if cycle_seconds else None,
+            "notifications_per_s": round(delivered / deliver_seconds, 1) if deliver_seconds else None,
+        },
+    }
+
+def run_browser(rows, cycles, workdir, profile="full"):
+    # AlertService.check_interruptions() on the Selenium backend against the local page, one pass per area and cycle;
+    # Chrome's received bytes and peak memory are measured per check
+    os.chdir(workdir)
+    import erpsever_core
+    import erpsever_wait
+
+    stages = StageTimer()
+
+    class RecordingTimer(erpsever_wait.PhaseTimer):
+        def report(self):
+            for name, seconds in self.phases:
+                stages.record(name, seconds)
+
+    erpsever_wait.PhaseTimer = RecordingTimer
+    backend = erpsever_core.SeleniumBackend(profile, measure=True)
+    measurements = []
+    services = []
+    for area, _, text in rows:
+        if area not in (service.municipality for service in services):
+            target = (parse_locations(text)[0] or ("",))[0]
+            services.append(erpsever_core.AlertService(area, target, {"email": ["bench@example.com"]}, backend))
+
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for _ in range(cycles):
+            for service in services:
+                service.fingerprints.reset()
+                stages.wrap("check_interruptions", service.check_interruptions)()
+                if backend.browser.last_measurement:
+                    measurements.append(backend.browser.last_measurement)
+    backend.close()
+    return {
+        "profile": profile,
+        "stages": stages.summary(),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "received_bytes_per_check": round(statistics.mean(m["received_bytes"] for m in measurements)) if measurements else None,
+        "browser_peak_memory_mb": max((m["peak_memory_mb"] for m in measurements), default=None),
+    }
+
+def in_child(func, *args):
+    # One fresh process per run, so peak RSS and imported state do not leak between scales
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as executor:
+        return executor.submit(func, *args).result()
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+def compare(baseline_path, results):
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = {(run["subscribers"], run["row_scale"]): run for run in json.load(file)["runs"]}
+    for run in results["runs"]:
+        old = baseline.get((run["subscribers"], run["row_scale"]))
+        if old is None:
+            continue
+        print(f"{run['subscribers']} subscribers x{run['row_scale']} rows vs. baseline:")
+        for name, stage in run["stages"].items():
+            if name in old["stages"] and old["stages"][name]["p50_ms"]:
+                ratio = stage["p50_ms"] / old["stages"][name]["p50_ms"]
+                print(f"  {name:16} p50 {old['stages'][name]['p50_ms']:10.2f} -> {stage['p50_ms']:10.2f} ms ({ratio:.2f}x)")
+
+def print_run(run):
+    print(f"{run['subscribers']} subscribers, {run['rows']} rows (x{run['row_scale']}): "
+          f"{run['notifications_per_cycle']} notifications/cycle, peak RSS {run['peak_rss_mb']} MB, "
+          f"{run['throughput']['interruptions_per_s']} interruptions/s, {run['throughput']['notifications_per_s']} notifications/s")
+    for name, stage in run["stages"].items():
+        print(f"  {name:16} p50 {stage['p50_ms']:10.2f}  p90 {stage['p90_ms']:10.2f}  p99 {stage['p99_ms']:10.2f} ms  (n={stage['count']})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the scrape -> parse -> match -> notify pipeline")
+    parser.add_argument("csv", nargs="?", default="interruption_data.csv", help="Rows the local page is built from")
+    parser.add_argument("--subscribers", default=DEFAULT_SUBSCRIBERS, help="Comma-separated subscriber counts")
+    parser.add_argument("--row-scale", default=DEFAULT_ROW_SCALES, help="Comma-separated multipliers of the CSV rows")
+    parser.add_argument("--match-ratio", type=float, default=DEFAULT_MATCH_RATIO)
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--browser", action="store_true", help="Also time the Selenium path (needs Chrome)")
+    parser.add_argument("--browser-profile", default="full", help="Comma-separated browser profiles to time, e.g. full,lean")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", metavar="JSON", help="Earlier results to compare the p50 latencies with")
+    args = parser.parse_args()
+
+    source_rows = load_rows(args.csv)
+    server = start_server()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    erpsever_http.FIXTURE_MODE = "off"
+    erpsever_http.URL = base_url + "/"
+    erpsever_http.AREA_DATA_URL = base_url + "/area?name={area}"
+    print(f"Serving the replayed page at {base_url}/")
+
+    results = {"version": git_version(), "python": platform.python_version(), "started": time.time(),
+               "match_ratio": args.match_ratio, "cycles": args.cycles, "runs": [], "browser": []}
+    with tempfile.TemporaryDirectory() as workdir:
+        for row_scale in (int(value) for value in args.row_scale.split(",")):
+            rows = scale_rows(source_rows, row_scale)
+            server.pages = build_pages(rows)
+            for count in (int(value) for value in args.subscribers.split(",")):
+                subscribers_file = os.path.join(workdir, f"subscribers-{count}.csv")
+                write_subscribers(subscribers_file, rows, count, args.match_ratio)
+                rundir = tempfile.mkdtemp(dir=workdir)
+                run = {"subscribers": count, "row_scale": row_scale, "rows": len(rows)}
+                run.update(in_child(run_fanout, subscribers_file, rows, args.cycles, rundir))
+                results["runs"].append(run)
+                print_run(run)
+
+            for profile in (args.browser_profile.split(",") if args.browser else ()):
+                browser_run = {"row_scale": row_scale, "rows": len(rows)}
+                browser_run.update(in_child(run_browser, rows, args.cycles, tempfile.mkdtemp(dir=workdir), profile))
+                results["browser"].append(browser_run)
+                print(f"Browser path ({profile} profile), {len(rows)} rows: peak RSS {browser_run['peak_rss_mb']} MB, "
+                      f"Chrome peak {browser_run['browser_peak_memory_mb']} MB, "
+                      f"{browser_run['received_bytes_per_check']} bytes received per check")
+                for name, stage in browser_run["stages"].items():
+                    print(f"  {name:18} p50 {stage['p50_ms']:10.2f}  p90 {stage['p90_ms']:10.2f} ms  (n={stage['count']})")
+    server.shutdown()
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == "__main__":
+    main()
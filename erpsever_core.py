@@ -0,0 +1,380 @@
+import importlib
+import os
+import time
+import schedule
+import erpsever_http
+from erpsever_dispatch import Dispatcher
+from erpsever_match import TargetMatcher
+from erpsever_metrics import CHECK_SECONDS, CHECKS, ELEMENT_WAIT_SECONDS, install_profile_signal, profiled, start_metrics_server
+from erpsever_page import AREA_ITEMS_SELECTOR, area_items, list_html, read_interruption_rows
+from erpsever_poll import POLL_MODE, Fingerprints, run_adaptive
+from erpsever_seen import SeenStore
+from erpsever_reminders import ReminderScheduler
+from erpsever_snapshot import NOTICE_SUBJECTS, SnapshotStore, notice_kind, notice_text
+
+# Shared check path of the alert services. Selenium, webdriver_manager, twilio and pywhatkit are
+# imported only when the backend or channel that needs them is first used.
+
+# "selenium" drives a headless Chrome, "http" reads the interruption list without a browser
+FETCH_BACKEND = os.getenv("FETCH_BACKEND", "selenium")
+# Extra notifier plugins, e.g. "sms=my_sms:make_channel,push=my_push:PushChannel"
+NOTIFIER_PLUGINS = os.getenv("NOTIFIER_PLUGINS", "")
+
+# Checked on every page load, so a redesign of the site shows up in the log right away
+PAGE_HIERARCHY = [
+    ('div.map-interruptions', 'Map Interruptions div'),
+    ('body > div.table.site-table', 'Main table div'),
+    ('body > div.table.site-table > main', 'Main tag'),
+    ('body > div.table.site-table > main > section:nth-of-type(2)', 'Second section'),
+    ('body > div.table.site-table > main > section:nth-of-type(2) > div.wrapper', 'Wrapper div'),
+]
+
+# Notifier plugins: channel name -> "module:factory", imported when the channel sends its first message
+NOTIFIERS = {
+    "email": "erpsever_dispatch:EmailChannel",
+    "twilio": "erpsever_dispatch:TwilioChannel",
+    "pywhatkit": "erpsever_core:pywhatkit_channel",
+}
+
+def check_element_presence(driver, css_selector, description):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    with ELEMENT_WAIT_SECONDS.time(element=description):
+        element = WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.CSS_SELECTOR, css_selector)))
+    print(f"{description} found: {element.tag_name}")
+    return element
+
+def find_area(driver, municipality):
+    # The sidebar item whose name is municipality, or failing that the first one containing it
+    from selenium.webdriver.common.by import By
+
+    partial = None
+    for item in driver.find_elements(By.CSS_SELECTOR, AREA_ITEMS_SELECTOR):
+        area = item.find_element(By.TAG_NAME, 'strong').text.strip()
+        print(f"Found area: {area}")  # Debug: Print the area name
+        if area == municipality:
+            return item
+        if partial is None and municipality in area:
+            partial = item
+    return partial
+
+def open_page(driver, timer):
+    # Load the page, check each element in the hierarchy and close the modal overlay if it is shown
+    from erpsever_driver import load_page
+    from erpsever_wait import dismiss_modal, wait_for_page
+
+    with timer.phase("page load"):
+        load_page(driver, erpsever_http.URL)
+
+        # Wait for the map widget to render, then check each element in the hierarchy
+        wait_for_page(driver)
+        for css_selector, description in PAGE_HIERARCHY:
+            check_element_presence(driver, css_selector, description)
+
+    # Close the modal overlay if it is shown and wait for it to disappear
+    with timer.phase("modal dismissal"):
+        dismiss_modal(driver)
+
+def read_selected(driver, area, item, timer, fingerprints=None):
+    # Click item and return the [area, period, text] rows of its list; None when the list is the same
+    # as on the previous check. Raises TimeoutException when the list was not drawn for this area
+    from erpsever_wait import click_and_wait_for_list
+
+    # Click the area and wait until its interruption list has been drawn
+    with timer.phase("list ready"):
+        state = click_and_wait_for_list(driver, item)
+        print(f"Interruption list ready: {state['items']} entries after {state['mutations']} DOM updates.")  # Debug statement
+
+    # Nothing to parse or match when the list is the same as on the previous check
+    if fingerprints is not None:
+        with timer.phase("fingerprint"):
+            changed = fingerprints.changed(("list", area), list_html(driver) or "")
+        if not changed:
+            print(f"Interruption list of {area} unchanged since the last check, skipping.")
+            return None
+
+    with timer.phase("parse"):
+        rows = read_interruption_rows(driver, area)
+        print(f"Found {len(rows)} interruption entries.")  # Debug statement
+    return rows
+
+def read_interruptions(driver, municipality, fingerprints=None):
+    # Open the page, click the municipality and return its [area, period, text] rows; None when the
+    # municipality is missing or its list is the same as on the previous check
+    from erpsever_wait import PhaseTimer
+
+    timer = PhaseTimer()
+    open_page(driver, timer)
+
+    with timer.phase("area click"):
+        selected = find_area(driver, municipality)
+
+    if selected is None:
+        print(f"Municipality '{municipality}' not found.")
+        timer.report()
+        return None
+    print(f"Found and clicking on municipality: {municipality}")
+
+    rows = read_selected(driver, municipality, selected, timer, fingerprints)
+    timer.report()
+    return rows
+
+def read_areas(driver, areas, fingerprints=None):
+    # Open the page once and click every needed area in turn; {area: rows} of the areas whose list
+    # changed since the previous check
+    from selenium.common.exceptions import TimeoutException
+    from erpsever_wait import PhaseTimer
+
+    timer = PhaseTimer()
+    open_page(driver, timer)
+
+    rows_by_area = {}
+    for area, item in area_items(driver).items():
+        if area not in areas:
+            continue
+        print(f"Processing area: {area}")
+        try:
+            rows = read_selected(driver, area, item, timer, fingerprints)
+        except TimeoutException as e:
+            # The late list could still land while the next area is being read, so the remaining areas
+            # wait for the next check on a freshly loaded page
+            print(f"Failed to find the interruption data of {area}: {e.msg}")
+            if not rows_by_area:
+                timer.report()
+                raise
+            break
+        if rows is not None:
+            rows_by_area[area] = rows
+    timer.report()
+    return rows_by_area
+
+class SeleniumBackend:
+    name = "selenium"
+
+    def __init__(self, profile=None, measure=None):
+        # profile and measure default to BROWSER_PROFILE and BROWSER_MEASURE
+        self.profile = profile
+        self.measure = measure
+        self.browser = None
+
+    def prepare(self):
+        # Resolve the chromedriver once at startup instead of on every run
+        from erpsever_driver import get_driver_path
+        get_driver_path()
+
+    def driver(self):
+        if self.browser is None:
+            from erpsever_driver import BrowserSession
+            # One warm browser shared by every scheduled run
+            self.browser = BrowserSession(profile=self.profile, measure=self.measure)
+        return self.browser.get_driver()
+
+    def read(self, municipality, fingerprints=None):
+        driver = self.driver()
+        with self.browser.measure():
+            return read_interruptions(driver, municipality, fingerprints)
+
+    def read_many(self, areas, fingerprints=None):
+        # {area: rows} of the areas whose list changed, read in one page load
+        driver = self.driver()
+        with self.browser.measure():
+            return read_areas(driver, areas, fingerprints)
+
+    def close(self):
+        if self.browser is not None:
+            self.browser.quit()
+
+class HttpBackend:
+    name = "http"
+
+    def __init__(self):
+        self.session = None
+        self.ready = False
+
+    def prepare(self):
+        pass
+
+    def get_session(self):
+        if not self.ready:
+            self.session = erpsever_http.get_session()
+            self.ready = True
+        return self.session
+
+    def read(self, municipality, fingerprints=None):
+        # Raises when the list cannot be read, so a failed read is not taken for an area without outages
+        return erpsever_http.read_area(self.get_session(), municipality, fingerprints)
+
+    def read_many(self, areas, fingerprints=None):
+        # {area: rows} of the areas whose list changed; an area that cannot be read is left out (not reported
+        # as empty), and when none can be read the last error is raised
+        session = self.get_session()
+        rows_by_area = {}
+        failed = 0
+        for area in areas:
+            try:
+                rows = erpsever_http.read_area(session, area, fingerprints)
+            except Exception as e:
+                print(f"Failed to extract interruption data for area {area}: {e}")
+                failed += 1
+                error = e
+                continue
+            if rows is not None:
+                rows_by_area[area] = rows
+        if failed and failed == len(areas):
+            raise error
+        return rows_by_area
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+BACKENDS = {"selenium": SeleniumBackend, "http": HttpBackend}
+
+def pywhatkit_channel():
+    # pywhatkit opens a browser when it is imported, so send_pywhatkit imports it on the first message
+    from erpsever_dispatch import FunctionChannel, send_pywhatkit
+    return FunctionChannel(send_pywhatkit)
+
+def notifier_specs():
+    specs = dict(NOTIFIERS)
+    for entry in filter(None, (part.strip() for part in NOTIFIER_PLUGINS.split(","))):
+        name, spec = entry.split("=", 1)
+        specs[name.strip()] = spec.strip()
+    return specs
+
+def load_notifier(name):
+    specs = notifier_specs()
+    if name not in specs:
+        raise ValueError(f"Unknown channel '{name}', expected one of: {', '.join(sorted(specs))}")
+    module, factory = specs[name].split(":", 1)
+    return getattr(importlib.import_module(module), factory)()
+
+class LazyChannel:
+    # Dispatcher channel that loads its notifier plugin on the first batch it has to send
+
+    def __init__(self, name):
+        self.name = name
+        self.channel = None
+
+    def send_batch(self, messages):
+        if self.channel is None:
+            self.channel = load_notifier(self.name)
+        return self.channel.send_batch(messages)
+
+class AlertService:
+    # One municipality and target, read through one backend and reported on any mix of channels
+
+    def __init__(self, municipality, target_text, recipients, backend=FETCH_BACKEND, max_distance=0):
+        # recipients: {"email": ["someone@example.com"], "twilio": ["+359..."], ...}; max_distance > 0 also
+        # reports near misses of a target typed in Latin letters (see erpsever_match)
+        self.municipality = municipality
+        self.target_text = target_text
+        # Case and transliteration tolerant, e.g. "с. Батово" also finds "Batovo"
+        self.matcher = TargetMatcher(max_distance)
+        self.matcher.add(target_text, target_text)
+        self.matcher.build()
+        self.recipients = {channel: list(addresses) for channel, addresses in recipients.items() if addresses}
+        specs = notifier_specs()
+        for channel in self.recipients:
+            if channel not in specs:
+                raise ValueError(f"Unknown channel '{channel}', expected one of: {', '.join(sorted(specs))}")
+        self.backend = BACKENDS[backend]() if isinstance(backend, str) else backend
+        # Last interruption list, so an unchanged list is not parsed and matched again
+        self.fingerprints = Fingerprints()
+        # Interruptions already reported, so every match is sent once per recipient
+        self.seen = SeenStore()
+        # Previous list of the municipality, so only new, changed and cancelled entries are matched
+        self.snapshots = SnapshotStore()
+        # The snapshot file may be shared with other services, so the first list after startup is matched
+        # in full and SeenStore drops what was already sent
+        self.diffed = False
+        # Messages are queued and sent by one background worker per channel
+        self.dispatcher = Dispatcher({channel: LazyChannel(channel) for channel in self.recipients})
+        # Reminders before and after every outage window of the reported interruptions
+        self.reminders = ReminderScheduler(self.dispatcher)
+
+    def notify_matches(self, rows):
+        if not rows:
+            print("No planned power interruptions found.")  # Message if no interruptions are found
+
+        self.seen.purge_expired()
+        matches = 0
+        notices = []
+        for event in self.snapshots.diff(self.municipality, rows, everything=not self.diffed):
+            listed = event.text is not None and bool(self.matcher.find(event.text))
+            earlier = event.old_text is not None and bool(self.matcher.find(event.old_text))
+            if not listed and not earlier:
+                continue
+            matches += 1
+            for channel, addresses in self.recipients.items():
+                for recipient in addresses:
+                    kind = notice_kind(event, self.seen, f"{channel}:{recipient}", listed)
+                    if kind is None:
+                        print(f"Message to {recipient} already sent. Skipping.")
+                        continue
+                    print(f"{kind.capitalize()} interruption for {self.target_text}, notifying {recipient} via {channel}.")
+                    self.dispatcher.enqueue(channel, recipient, notice_text(kind, event), NOTICE_SUBJECTS[kind].format(self.target_text))
+                    notices.append((kind, event, channel, recipient, self.target_text))
+        self.reminders.follow_many(notices)
+        self.seen.flush()
+        self.snapshots.flush()
+        self.diffed = True
+
+        if not matches:
+            print(f"No new, changed or cancelled interruptions for {self.target_text}.")  # Debug statement
+
+    def check_interruptions(self):
+        # Returns the rows that were checked, or None when the list had not changed
+        with CHECK_SECONDS.time(backend=self.backend.name):
+            rows = self.backend.read(self.municipality, self.fingerprints)
+            if rows is not None:
+                self.notify_matches(rows)
+        return rows
+
+    @profiled
+    def job(self):
+        try:
+            rows = self.check_interruptions()
+        except Exception as e:
+            # The browser is health-checked on the next run and restarted only if it is broken
+            print(f"Interruption check failed: {e}")
+            CHECKS.inc(result="failed")
+            return None
+        CHECKS.inc(result="unchanged" if rows is None else "changed")
+        return rows
+
+    def start(self):
+        self.backend.prepare()
+        self.dispatcher.start()
+        self.reminders.start()
+
+    def close(self):
+        self.backend.close()
+        self.reminders.stop()
+        self.dispatcher.stop()
+        self.seen.close()
+        self.snapshots.close()
+
+def run_service(service, every_minutes):
+    # Check every every_minutes (or adaptively with POLL_MODE=adaptive) until interrupted
+    # /metrics endpoint (METRICS_PORT) and SIGUSR1 / trigger file for profiling one cycle
+    start_metrics_server()
+    install_profile_signal()
+
+    service.start()
+    print("Service started...")
+
+    try:
+        if POLL_MODE == "adaptive":
+            # Check more often around the usual publication hours and back off while the page is quiet
+            run_adaptive(service.job)
+        else:
+            schedule.every(every_minutes).minutes.do(service.job)
+            while True:
+                schedule.run_pending()
+                # Sleep until the next check is due instead of waking up every second
+                time.sleep(max(schedule.idle_seconds() or 0, 1))
+    finally:
+        service.close()
@@ -0,0 +1,390 @@
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import os
+import smtplib
+import socketserver
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs
+from erpsever_metrics import NOTIFICATIONS, SEND_SECONDS
+
+DISPATCH_QUEUE_FILE = os.getenv("DISPATCH_QUEUE_FILE", "dispatch_queue.db")
+MAX_ATTEMPTS = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("DISPATCH_RETRY_SECONDS", "30"))
+BATCH_SIZE = 50
+# Messages claimed by a worker that died are handed out again after this long
+CLAIM_TIMEOUT_SECONDS = 600
+# Pause before a worker tries again after the queue file could not be read or written (e.g. locked)
+WORKER_RETRY_SECONDS = 10
+
+# SMTP relay for email; without SMTP_HOST every email is handed to the local sendmail binary
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "0") == "1"
+EMAIL_SENDER = os.getenv("EMAIL_SENDER", "alerts@localhost")
+
+# Twilio credentials and an optional API base URL for a local fake endpoint
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
+TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER", "")
+TWILIO_API_URL = os.getenv("TWILIO_API_URL")
+
+class Message:
+    __slots__ = ("id", "channel", "recipient", "subject", "body", "attempts")
+
+    def __init__(self, id, channel, recipient, subject, body, attempts):
+        self.id = id
+        self.channel = channel
+        self.recipient = recipient
+        self.subject = subject
+        self.body = body
+        self.attempts = attempts
+
+class RateLimiter:
+    # Token bucket: up to `burst` messages at once, refilled at `per_second`
+
+    def __init__(self, per_second, burst=1):
+        self.per_second = per_second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.per_second)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.per_second)
+
+class EmailChannel:
+    # Sends a whole batch over one SMTP connection
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS, sender=EMAIL_SENDER, per_second=10):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender
+        self.rate_limit = RateLimiter(per_second, burst=20)
+
+    def send_batch(self, messages):
+        # Returns {message id: error or None}
+        if not self.host:
+            return {message.id: self.sendmail(message) for message in messages}
+
+        results = {}
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            for message in messages:
+                self.rate_limit.acquire()
+                email = EmailMessage()
+                email["From"] = self.sender
+                email["To"] = message.recipient
+                email["Subject"] = message.subject
+                email.set_content(message.body)
+                try:
+                    smtp.send_message(email)
+                    results[message.id] = None
+                except smtplib.SMTPException as e:
+                    results[message.id] = str(e)
+        return results
+
+    def sendmail(self, message):
+        self.rate_limit.acquire()
+        process = subprocess.run(['sendmail', message.recipient], input=f"Subject: {message.subject}\n\n{message.body}".encode('utf-8'))
+        return None if process.returncode == 0 else f"sendmail exited with {process.returncode}"
+
+class TwilioChannel:
+    # One Twilio client (and its HTTP connection pool) for the life of the process
+
+    def __init__(self, account_sid=TWILIO_ACCOUNT_SID, auth_token=TWILIO_AUTH_TOKEN,
+                 from_number=TWILIO_WHATSAPP_NUMBER, api_url=TWILIO_API_URL, per_second=1):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.api_url = api_url
+        self.client = None
+        self.rate_limit = RateLimiter(per_second, burst=5)
+
+    def get_client(self):
+        if self.client is None:
+            from twilio.rest import Client
+
+            self.client = Client(self.account_sid, self.auth_token)
+            if self.api_url:
+                self.client.api.base_url = self.api_url
+        return self.client
+
+    def send_batch(self, messages):
+        client = self.get_client()
+        results = {}
+        for message in messages:
+            self.rate_limit.acquire()
+            try:
+                client.messages.create(body=message.body, from_=self.from_number, to=f"whatsapp:{message.recipient}")
+                results[message.id] = None
+            except Exception as e:
+                results[message.id] = str(e)
+        return results
+
+def send_pywhatkit(recipient, body):
+    import pywhatkit  # Opens a browser on import, so only when a message is actually sent
+
+    pywhatkit.sendwhatmsg_instantly(recipient, body)
+
+class FunctionChannel:
+    # Wraps a send(recipient, body) function, e.g. pywhatkit, which has to drive a browser per message
+
+    def __init__(self, send, per_second=1 / 30):
+        self.send = send
+        self.rate_limit = RateLimiter(per_second=per_second)
+
+    def send_batch(self, messages):
+        results = {}
+        for message in messages:
+            self.rate_limit.acquire()
+            try:
+                self.send(message.recipient, message.body)
+                results[message.id] = None
+            except Exception as e:
+                results[message.id] = str(e)
+        return results
+
+class Dispatcher:
+    # Persistent outbox drained by one worker thread per channel, so a slow provider blocks only itself
+
+    def __init__(self, channels, path=DISPATCH_QUEUE_FILE):
+        self.channels = channels
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS outbox (id TEXT PRIMARY KEY, channel TEXT, recipient TEXT, subject TEXT, "
+                "body TEXT, status TEXT, attempts INTEGER, next_attempt_at REAL, last_error TEXT, "
+                "created_at REAL, sent_at REAL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, channel, next_attempt_at)")
+        self.wakeups = {channel: threading.Event() for channel in channels}
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def enqueue(self, channel, recipient, body, subject=""):
+        self.enqueue_many([(channel, recipient, body, subject)])
+
+    def enqueue_many(self, messages):
+        # messages: (channel, recipient, body, subject) tuples, stored in one transaction
+        now = time.time()
+        rows = []
+        for channel, recipient, body, subject in messages:
+            if channel not in self.channels:
+                raise ValueError(f"Unknown channel '{channel}'")
+            rows.append((uuid.uuid4().hex, channel, recipient, subject, body, now, now))
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT INTO outbox VALUES (?, ?, ?, ?, ?, 'pending', 0, ?, NULL, ?, NULL)", rows)
+        for channel in {row[1] for row in rows}:
+            self.wakeups[channel].set()
+
+    def due(self, channel):
+        # Claim a batch of due messages; the claim keeps other processes on the same file from sending them too
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute(
+                    "UPDATE outbox SET status = 'pending' WHERE status = 'sending' AND channel = ? AND next_attempt_at <= ?",
+                    (channel, now - CLAIM_TIMEOUT_SECONDS),
+                )
+                rows = self.connection.execute(
+                    "SELECT id, channel, recipient, subject, body, attempts FROM outbox "
+                    "WHERE status = 'pending' AND channel = ? AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                    (channel, now, BATCH_SIZE),
+                ).fetchall()
+                self.connection.executemany(
+                    "UPDATE outbox SET status = 'sending', next_attempt_at = ? WHERE id = ?", [(now, row[0]) for row in rows]
+                )
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+        return [Message(*row) for row in rows]
+
+    def next_due_in(self, channel):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending' AND channel = ?", (channel,)
+            ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def record(self, messages, results):
+        now = time.time()
+        updates = []
+        for message in messages:
+            error = results.get(message.id, "no result")
+            attempts = message.attempts + 1
+            if error is None:
+                updates.append(("sent", attempts, now, None, now, message.id))
+            elif attempts >= MAX_ATTEMPTS:
+                updates.append(("failed", attempts, now, error, None, message.id))
+                print(f"Giving up on {message.channel} message to {message.recipient}: {error}")
+            else:
+                retry_at = now + RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+                updates.append(("pending", attempts, retry_at, error, None, message.id))
+                print(f"Failed to send {message.channel} message to {message.recipient}, retrying: {error}")
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, sent_at = ? WHERE id = ?",
+                updates,
+            )
+
+    def drain(self, channel):
+        # Send everything that is due on one channel; returns the number of messages handled
+        handled = 0
+        while True:
+            messages = self.due(channel)
+            if not messages:
+                return handled
+            try:
+                with SEND_SECONDS.time(channel=channel):
+                    results = self.channels[channel].send_batch(messages)
+            except Exception as e:
+                # Connection-level failure: the whole batch is retried
+                results = {message.id: str(e) for message in messages}
+            self.record(messages, results)
+            sent = sum(1 for error in results.values() if error is None)
+            NOTIFICATIONS.inc(sent, channel=channel, outcome="sent")
+            NOTIFICATIONS.inc(len(messages) - sent, channel=channel, outcome="failed")
+            print(f"Dispatched {sent}/{len(messages)} {channel} messages.")
+            handled += len(messages)
+
+    def worker(self, channel):
+        wakeup = self.wakeups[channel]
+        while not self.stopping.is_set():
+            wakeup.clear()
+            try:
+                self.drain(channel)
+                delay = self.next_due_in(channel)
+            except Exception as e:
+                # Several processes may share the queue file, so "database is locked" is expected now and then;
+                # the thread keeps running and claimed messages are handed out again after CLAIM_TIMEOUT_SECONDS
+                print(f"Dispatch worker for {channel} failed: {e}")
+                delay = WORKER_RETRY_SECONDS
+            wakeup.wait(60 if delay is None else delay)
+
+    def start(self):
+        for channel in self.channels:
+            thread = threading.Thread(target=self.worker, args=(channel,), name=f"dispatch-{channel}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=10):
+        self.stopping.set()
+        for wakeup in self.wakeups.values():
+            wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.connection.close()
+
+    def status(self):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT channel, status, COUNT(*) FROM outbox GROUP BY channel, status ORDER BY channel, status"
+            ).fetchall()
+
+    def retry_failed(self):
+        with self.lock, self.connection:
+            return self.connection.execute(
+                "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'failed'", (time.time(),)
+            ).rowcount
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    # Just enough SMTP to accept messages from smtplib and print them
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('utf-8'))
+
+    def handle(self):
+        self.reply("220 stub SMTP ready")
+        while True:
+            line = self.rfile.readline().decode('utf-8', 'replace').strip()
+            if not line:
+                return
+            command = line.split(" ", 1)[0].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif command == "DATA":
+                self.reply("354 end with <CRLF>.<CRLF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode('utf-8', 'replace')
+                    if data in (".\r\n", ".\n", ""):
+                        break
+                    lines.append(data)
+                subject = next((data[9:].strip() for data in lines if data.startswith("Subject: ")), "")
+                print(f"SMTP stub received: {subject}")
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+class StubTwilioHandler(BaseHTTPRequestHandler):
+    # Answers POST /2010-04-01/Accounts/<sid>/Messages.json like the Twilio API does
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode('utf-8'))
+        print(f"Twilio stub received message to {form.get('To', ['?'])[0]}")
+        payload = {"sid": "SM" + uuid.uuid4().hex, "status": "queued", "to": form.get("To", [""])[0],
+                   "from": form.get("From", [""])[0], "body": form.get("Body", [""])[0]}
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Notification dispatch queue tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="Show message counts per channel and status")
+    commands.add_parser("retry-failed", help="Queue failed messages again")
+    stub_smtp = commands.add_parser("stub-smtp", help="Run a local SMTP server that accepts and prints messages")
+    stub_smtp.add_argument("--port", type=int, default=1025)
+    stub_twilio = commands.add_parser("stub-twilio", help="Run a fake Twilio API endpoint (set TWILIO_API_URL to it)")
+    stub_twilio.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    if args.command == "stub-smtp":
+        with socketserver.ThreadingTCPServer(("127.0.0.1", args.port), StubSMTPHandler) as server:
+            print(f"Stub SMTP server on 127.0.0.1:{args.port}")
+            server.serve_forever()
+    elif args.command == "stub-twilio":
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), StubTwilioHandler)
+        print(f"Stub Twilio API on http://127.0.0.1:{args.port}")
+        server.serve_forever()
+    elif args.command == "retry-failed":
+        print(f"Queued {Dispatcher({}).retry_failed()} failed messages again.")
+    else:
+        for channel, status, count in Dispatcher({}).status():
+            print(f"{channel} {status}: {count}")
+
+if __name__ == "__main__":
+    main()
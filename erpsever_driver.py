@@ -0,0 +1,217 @@
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+from erpsever_metrics import BROWSER_RECEIVED_BYTES, BROWSER_RESTARTS, BROWSER_START_SECONDS, BROWSER_STARTS
+from contextlib import nullcontext
+import json
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # Memory checks are skipped without psutil
+    psutil = None
+
+# Restart the browser when Chrome and its children grow past this many MB
+MAX_BROWSER_MEMORY_MB = int(os.getenv("MAX_BROWSER_MEMORY_MB", "800"))
+# Restart the browser after this many hours even if it looks healthy
+MAX_BROWSER_AGE_HOURS = float(os.getenv("MAX_BROWSER_AGE_HOURS", "12"))
+
+# "full" is a regular desktop Chrome; "lean" blocks images, media, fonts, analytics and map tiles, uses a
+# small window, caps the JS heap and disk cache and stops waiting for the page at DOMContentLoaded
+BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "full")
+# Report the bytes Chrome received and its peak memory after every check
+BROWSER_MEASURE = os.getenv("BROWSER_MEASURE", "") not in ("", "0")
+LEAN_WINDOW_SIZE = "1024,768"
+LEAN_JS_HEAP_MB = int(os.getenv("LEAN_JS_HEAP_MB", "128"))
+LEAN_DISK_CACHE_MB = int(os.getenv("LEAN_DISK_CACHE_MB", "16"))
+# Requests the lean profile never makes; BROWSER_BLOCKED_URLS adds comma-separated patterns
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg", "*.wav",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*connect.facebook.net*",
+    "*facebook.com/tr*", "*hotjar.com*", "*yandex.ru/metrika*", "*mc.yandex.ru*",
+    "*tile.openstreetmap.org*", "*basemaps.cartocdn.com*", "*api.mapbox.com*", "*tiles.mapbox.com*",
+    "*maps.googleapis.com/maps/vt*", "*maps.googleapis.com/maps/api/staticmap*", "*khms*.google.com*",
+] + [pattern.strip() for pattern in os.getenv("BROWSER_BLOCKED_URLS", "").split(",") if pattern.strip()]
+BROWSER_PROFILES = ("full", "lean")
+# Seconds between memory samples while a check is measured
+MEASURE_SAMPLE_SECONDS = 0.25
+
+_driver_path = None
+
+def get_driver_path():
+    # Resolve the chromedriver path once; ChromeDriverManager().install() hits the network
+    global _driver_path
+    if _driver_path is None:
+        _driver_path = os.getenv("CHROMEDRIVER_PATH") or ChromeDriverManager().install()
+        print(f"Using chromedriver at {_driver_path}")
+    return _driver_path
+
+def setup_driver(profile=None, measure=None):
+    # Set up the Chrome driver using the cached driver path
+    profile = profile or BROWSER_PROFILE
+    if profile not in BROWSER_PROFILES:
+        raise ValueError(f"Unknown browser profile '{profile}', expected one of: {', '.join(BROWSER_PROFILES)}")
+    service = Service(get_driver_path())
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless")  # Run in headless mode
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    if profile == "lean":
+        options.add_argument(f"--window-size={LEAN_WINDOW_SIZE}")
+        options.add_argument(f"--js-flags=--max-old-space-size={LEAN_JS_HEAP_MB}")
+        options.add_argument(f"--disk-cache-size={LEAN_DISK_CACHE_MB * 1024 * 1024}")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-background-networking")
+        options.add_argument("--mute-audio")
+        # The interruption list is read once the DOM is there; waiting for every subresource is not needed
+        options.page_load_strategy = "eager"
+    else:
+        options.add_argument("--window-size=1920x1080")
+    if measure if measure is not None else BROWSER_MEASURE:
+        # Network events are read back from the performance log to count the bytes received
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    with BROWSER_START_SECONDS.time():
+        driver = webdriver.Chrome(service=service, options=options)
+    BROWSER_STARTS.inc()
+    if profile == "lean":
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+    return driver
+
+def received_bytes(driver):
+    # Bytes received and requests finished since the last call, from the performance log
+    total = requests = 0
+    for entry in driver.get_log("performance"):
+        message = json.loads(entry["message"])["message"]
+        if message["method"] == "Network.loadingFinished":
+            total += message["params"].get("encodedDataLength", 0)
+            requests += 1
+    return total, requests
+
+def load_page(driver, url):
+    # Refresh the page when the browser is already on it instead of navigating again
+    if driver.current_url == url:
+        driver.refresh()
+    else:
+        driver.get(url)
+
+class CycleMeter:
+    # Bytes received and peak memory of Chrome during one check; memory is sampled on a background thread
+
+    def __init__(self, session):
+        self.session = session
+        self.peak_mb = 0
+        self.stopped = threading.Event()
+
+    def sample(self):
+        while True:
+            memory = self.session.memory_mb()
+            if memory is not None:
+                self.peak_mb = max(self.peak_mb, memory)
+            if self.stopped.wait(MEASURE_SAMPLE_SECONDS):
+                return
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        try:
+            total, requests = received_bytes(self.session.driver)
+        except Exception as e:
+            print(f"Failed to read the browser network log: {e}")
+            return False
+        BROWSER_RECEIVED_BYTES.inc(total, profile=self.session.profile)
+        self.session.last_measurement = {"received_bytes": total, "requests": requests, "peak_memory_mb": round(self.peak_mb, 1)}
+        print(f"Browser cycle ({self.session.profile} profile): {total / 1024:.0f} KB received in {requests} requests, "
+              f"peak memory {self.peak_mb:.0f} MB, {time.perf_counter() - self.started:.1f} s")
+        return False
+
+class BrowserSession:
+    # Keeps one warm browser across schedule ticks and restarts it only when needed
+
+    def __init__(self, max_memory_mb=MAX_BROWSER_MEMORY_MB, max_age_hours=MAX_BROWSER_AGE_HOURS,
+                 profile=None, measure=None):
+        self.max_memory_mb = max_memory_mb
+        self.max_age_seconds = max_age_hours * 3600
+        self.profile = profile or BROWSER_PROFILE
+        self.measuring = BROWSER_MEASURE if measure is None else measure
+        self.last_measurement = None
+        self.driver = None
+        self.started_at = None
+
+    def start(self):
+        get_driver_path()
+        self.driver = setup_driver(self.profile, self.measuring)
+        self.started_at = time.monotonic()
+        print("Browser started.")
+        return self.driver
+
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                print(f"Failed to quit browser cleanly: {e}")
+        self.driver = None
+        self.started_at = None
+
+    def restart(self, reason="requested"):
+        print(f"Restarting browser ({reason}).")
+        BROWSER_RESTARTS.inc()
+        self.quit()
+        return self.start()
+
+    def memory_mb(self):
+        # Resident memory of chromedriver and every Chrome process it spawned
+        if psutil is None or self.driver is None:
+            return None
+        try:
+            root = psutil.Process(self.driver.service.process.pid)
+            processes = [root] + root.children(recursive=True)
+            total = 0
+            for process in processes:
+                try:
+                    total += process.memory_info().rss
+                except psutil.Error:
+                    pass
+            return total / (1024 * 1024)
+        except (psutil.Error, AttributeError):
+            return None
+
+    def check_health(self):
+        # Return the reason the browser needs a restart, or None when it is fine
+        if self.driver is None:
+            return "not running"
+        try:
+            self.driver.execute_script("return document.readyState")
+        except Exception as e:
+            return f"unresponsive: {e}"
+        if time.monotonic() - self.started_at > self.max_age_seconds:
+            return "max age reached"
+        memory = self.memory_mb()
+        if memory is not None and memory > self.max_memory_mb:
+            return f"memory {memory:.0f} MB over {self.max_memory_mb} MB"
+        return None
+
+    def measure(self):
+        # Wrap one check to report its bytes and peak memory (BROWSER_MEASURE=1); a no-op otherwise
+        return CycleMeter(self) if self.measuring and self.driver is not None else nullcontext()
+
+    def get_driver(self):
+        if self.driver is None:
+            return self.start()
+        reason = self.check_health()
+        if reason:
+            return self.restart(reason)
+        return self.driver
@@ -1,69 +1,256 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+from concurrent.futures import ThreadPoolExecutor
+from erpsever_driver import setup_driver
+from erpsever_page import AREAS_SELECTOR, area_items, read_interruption_rows
+from erpsever_wait import click_and_wait_for_list
+import argparse
 import csv
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
 import time
+import erpsever_http
 
-def setup_driver():
-    # Set up the Chrome driver using WebDriverManager
-    driver_path = ChromeDriverManager().install()
-    service = Service(driver_path)
-    options = webdriver.ChromeOptions()
-    options.add_argument("--headless")  # Run in headless mode
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--window-size=1920x1080")
-    driver = webdriver.Chrome(service=service, options=options)
-    return driver
-
-def extract_interruption_data(driver, area):
-    data = []
+URL = erpsever_http.URL
+
+# "selenium" drives a headless Chrome, "http" reads the interruption lists without a browser
+FETCH_BACKEND = os.getenv("FETCH_BACKEND", "selenium")
+
+# Per-area results of an unfinished crawl, so a rerun only crawls the missing and failed areas
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "extract_checkpoint")
+# A checkpoint older than this is stale and a new crawl starts from scratch
+CHECKPOINT_MAX_AGE_HOURS = float(os.getenv("CHECKPOINT_MAX_AGE_HOURS", "6"))
+OUTPUT_CSV = 'interruption_data.csv'
+HEADER = ['Area', 'Period', 'Text']
+
+def replace_file(path, write, mode='w', **kwargs):
+    # Write to a temporary file next to path and move it over path, so path is never half-written
+    temporary = f"{path}.tmp"
+    with open(temporary, mode, **kwargs) as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+def write_csv(rows, path=OUTPUT_CSV):
+    def write(csv_file):
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(HEADER)
+        csv_writer.writerows(rows)
+    replace_file(path, write, newline='', encoding='utf-8')
+
+class Checkpoint:
+    # One committed CSV per finished area plus manifest.json with the state of every area
+
+    def __init__(self, path=CHECKPOINT_DIR, max_age_hours=CHECKPOINT_MAX_AGE_HOURS):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.manifest = {"started": time.time(), "areas": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as file:
+                manifest = json.load(file)
+            if time.time() - manifest.get("started", 0) <= max_age_hours * 3600:
+                self.manifest = manifest
+            else:
+                print("Discarding a stale checkpoint.")
+                self.clear()
+                os.makedirs(path, exist_ok=True)
+
+    def area_path(self, area):
+        return os.path.join(self.path, area.replace(" ", "_") + ".csv")
+
+    def save_manifest(self):
+        replace_file(self.manifest_path, lambda file: json.dump(self.manifest, file, ensure_ascii=False, indent=1),
+                     encoding='utf-8')
+
+    def pending(self, areas):
+        done = {area for area, entry in self.manifest["areas"].items() if entry["status"] == "done"}
+        return [area for area in areas if area not in done]
+
+    def commit(self, area, rows):
+        # The area file is complete on disk before the manifest says so
+        replace_file(self.area_path(area), lambda file: csv.writer(file).writerows(rows), newline='', encoding='utf-8')
+        with self.lock:
+            self.manifest["areas"][area] = {"status": "done", "rows": len(rows), "at": time.time()}
+            self.save_manifest()
+
+    def fail(self, area, error):
+        with self.lock:
+            self.manifest["areas"][area] = {"status": "failed", "error": str(error), "at": time.time()}
+            self.save_manifest()
+
+    def rows(self, areas):
+        for area in areas:
+            with open(self.area_path(area), newline='', encoding='utf-8') as file:
+                yield from csv.reader(file)
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+def finish(checkpoint, areas):
+    # Write the final CSV once every area is in; returns False when some are still missing
+    missing = checkpoint.pending(areas)
+    if missing:
+        print(f"{len(missing)} of {len(areas)} areas failed or are missing ({', '.join(missing)}); "
+              f"{OUTPUT_CSV} was left as it was. Run again to retry only these areas.")
+        return False
+    write_csv(checkpoint.rows(areas))
+    checkpoint.clear()
+    return True
+
+def report(results, workers, started):
+    # results: (area, rows, seconds, worker) tuples in crawl order
+    for area, rows, seconds, worker in results:
+        print(f"{area}: {len(rows)} interruptions in {seconds:.2f} s (worker {worker})")
+    total_rows = sum(len(rows) for _, rows, _, _ in results)
+    print(f"Extracted {total_rows} interruptions from {len(results)} areas with {workers} workers in {time.perf_counter() - started:.2f} s")
+
+def open_areas(driver):
+    driver.get(URL)
     wait = WebDriverWait(driver, 60)
+    wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, AREAS_SELECTOR)))
+    return area_items(driver)
+
+def browser_worker(worker, area_queue, results, checkpoint, driver=None):
+    # Pull areas from the shared queue until it is empty; each worker owns one browser. A failed area
+    # is recorded in the checkpoint and the page is reopened (or the browser restarted) for the next one
+    items = None
     try:
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'ul#interruption_areas li[data-interruption="for_next_48_hours"]')))
-        interruptions = driver.find_elements(By.CSS_SELECTOR, 'ul#interruption_areas li[data-interruption="for_next_48_hours"]')
-        for interruption in interruptions:
-            period = interruption.find_element(By.CSS_SELECTOR, 'div.period').text
-            text = interruption.find_element(By.CSS_SELECTOR, 'div.text').text
-            data.append([area, period, text])
-    except Exception as e:
-        print(f"Failed to extract interruption data for area {area}: {e}")
-    return data
+        while True:
+            try:
+                area = area_queue.get_nowait()
+            except queue.Empty:
+                return
+            started = time.perf_counter()
+            try:
+                if driver is None:
+                    driver = setup_driver()
+                if items is None:
+                    items = open_areas(driver)
+                click_and_wait_for_list(driver, items[area])
+                rows = read_interruption_rows(driver, area)
+            except Exception as e:
+                print(f"Failed to extract interruption data for area {area}: {e}")
+                checkpoint.fail(area, e)
+                items = None
+                if not browser_alive(driver):
+                    quit_driver(driver)
+                    driver = None
+                continue
+            checkpoint.commit(area, rows)
+            results[area] = (rows, time.perf_counter() - started, worker)
+    finally:
+        quit_driver(driver)
 
-def main():
-    url = 'https://www.energo-pro.bg/bg/planirani-prekysvanija'
-    driver = setup_driver()
-    driver.get(url)
+def browser_alive(driver):
+    if driver is None:
+        return False
+    try:
+        driver.execute_script("return 1")
+        return True
+    except Exception:
+        return False
 
-    csv_file = open('interruption_data.csv', mode='w', newline='', encoding='utf-8')
-    csv_writer = csv.writer(csv_file)
-    csv_writer.writerow(['Area', 'Period', 'Text'])
+def quit_driver(driver):
+    if driver is not None:
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Failed to quit browser cleanly: {e}")
 
-    try:
-        # Wait for the sidebar to load and then find all area items
-        wait = WebDriverWait(driver, 60)
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'div.map-interruptions > div.sidebar > div.areas')))
-        
-        area_items = driver.find_elements(By.CSS_SELECTOR, 'div.map-interruptions > div.sidebar > div.areas > div.item')
-
-        for item in area_items:
-            area = item.find_element(By.TAG_NAME, 'strong').text
-            print(f"Processing area: {area}")
-            driver.execute_script("arguments[0].click();", item)
-            time.sleep(10)  # Wait for the data to load
-
-            # Extract and write interruption data to CSV
-            interruption_data = extract_interruption_data(driver, area)
-            for row in interruption_data:
-                csv_writer.writerow(row)
+def crawl_parallel(workers, checkpoint):
+    started = time.perf_counter()
 
-    finally:
-        csv_file.close()
+    # The first browser lists the areas and then works as worker 0
+    driver = setup_driver()
+    try:
+        areas = list(open_areas(driver))
+    except Exception:
         driver.quit()
+        raise
+
+    pending = checkpoint.pending(areas)
+    if len(pending) < len(areas):
+        print(f"Resuming: {len(areas) - len(pending)} areas already extracted, {len(pending)} to go.")
+    area_queue = queue.Queue()
+    for area in pending:
+        area_queue.put(area)
+    workers = max(1, min(workers, len(pending)))
+    results = {}
+    threads = [threading.Thread(target=browser_worker, args=(0, area_queue, results, checkpoint, driver))]
+    threads += [threading.Thread(target=browser_worker, args=(worker, area_queue, results, checkpoint))
+                for worker in range(1, workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    report([(area,) + results[area] for area in areas if area in results], workers, started)
+    return finish(checkpoint, areas)
+
+def main_http(checkpoint, workers=1):
+    started = time.perf_counter()
+    sessions = threading.local()
+
+    def fetch_area(area):
+        if not hasattr(sessions, "session"):
+            sessions.session = erpsever_http.get_session()
+        area_started = time.perf_counter()
+        try:
+            rows = erpsever_http.read_area(sessions.session, area)
+        except Exception as e:
+            print(f"Failed to extract interruption data for area {area}: {e}")
+            checkpoint.fail(area, e)
+            return None
+        checkpoint.commit(area, rows)
+        return area, rows, time.perf_counter() - area_started, threading.current_thread().name
+
+    areas = erpsever_http.fetch_areas(erpsever_http.get_session())
+    pending = checkpoint.pending(areas)
+    if len(pending) < len(areas):
+        print(f"Resuming: {len(areas) - len(pending)} areas already extracted, {len(pending)} to go.")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http") as executor:
+        results = [result for result in executor.map(fetch_area, pending) if result is not None]
+
+    report(results, workers, started)
+    return finish(checkpoint, areas)
+
+def archive_results():
+    # Keep the history: interruption_data.csv only ever holds the latest crawl
+    from erpsever_archive import HistoryArchive, read_csv_rows
+
+    added = HistoryArchive().append(read_csv_rows(OUTPUT_CSV))
+    print(f"Archived {added} new interruptions.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the planned interruptions of every area into interruption_data.csv")
+    parser.add_argument("--workers", type=int, default=1, help="Crawl areas in parallel with this many browsers or HTTP workers")
+    parser.add_argument("--archive", action="store_true", help="Also append new rows to the columnar history archive")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_DIR, help="Directory the per-area results are kept in until the crawl is complete")
+    parser.add_argument("--restart", action="store_true", help="Ignore an unfinished earlier crawl and start over")
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.restart:
+        checkpoint.clear()
+        checkpoint = Checkpoint(args.checkpoint)
+
+    if FETCH_BACKEND == "http":
+        complete = main_http(checkpoint, args.workers)
+    else:
+        complete = crawl_parallel(args.workers, checkpoint)
+    if not complete:
+        sys.exit(1)
+
+    if args.archive:
+        archive_results()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,191 @@
+import csv
+import os
+import time
+import schedule
+from erpsever_core import BACKENDS
+from erpsever_match import TargetMatcher
+from erpsever_poll import POLL_MODE, Fingerprints, run_adaptive
+from erpsever_metrics import CHECK_SECONDS, CHECKS, install_profile_signal, profiled, start_metrics_server
+from erpsever_seen import SeenStore
+from erpsever_reminders import ReminderScheduler
+from erpsever_snapshot import NOTICE_SUBJECTS, SnapshotStore, notice_kind, notice_text
+from erpsever_dispatch import Dispatcher, EmailChannel, FunctionChannel, TwilioChannel, send_pywhatkit
+
+# Subscriber table with Channel,Area,Target,Recipient columns; Channel is email, twilio or pywhatkit
+SUBSCRIBERS_FILE = os.getenv("SUBSCRIBERS_FILE", "subscribers.csv")
+CHECK_INTERVAL_MINUTES = int(os.getenv("CHECK_INTERVAL_MINUTES", "5"))
+# "selenium" drives a headless Chrome, "http" reads the interruption lists without a browser
+FETCH_BACKEND = os.getenv("FETCH_BACKEND", "selenium")
+
+CHANNELS = ("email", "twilio", "pywhatkit")
+
+class Subscriber:
+    __slots__ = ("channel", "area", "target", "recipient")
+
+    def __init__(self, channel, area, target, recipient):
+        self.channel = channel
+        self.area = area
+        self.target = target
+        self.recipient = recipient
+
+def load_subscribers(path=SUBSCRIBERS_FILE):
+    subscribers = []
+    with open(path, newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            channel = row['Channel'].strip().lower()
+            if channel not in CHANNELS:
+                print(f"Skipping subscriber {row['Recipient']}: unknown channel '{channel}'")
+                continue
+            subscribers.append(Subscriber(channel, row['Area'].strip(), row['Target'].strip(), row['Recipient'].strip()))
+    return subscribers
+
+def build_matchers(subscribers):
+    # One automaton per area, holding the target strings of every subscriber in that area
+    matchers = {}
+    for subscriber in subscribers:
+        matchers.setdefault(subscriber.area, TargetMatcher()).add(subscriber.target, subscriber)
+    for matcher in matchers.values():
+        matcher.build()
+    return matchers
+
+def alert_message(subscriber, kind, event):
+    # (channel, recipient, body, subject) for the dispatch queue
+    return subscriber.channel, subscriber.recipient, notice_text(kind, event), NOTICE_SUBJECTS[kind].format(subscriber.target)
+
+class FanoutService:
+    # Scrapes each subscribed area once per cycle and matches every interruption against all subscribers
+
+    def __init__(self, subscribers_file=SUBSCRIBERS_FILE, backend=FETCH_BACKEND):
+        self.subscribers_file = subscribers_file
+        self.backend = BACKENDS[backend]() if isinstance(backend, str) else backend
+        self.subscribers_mtime = None
+        self.matchers = {}
+        self.seen = SeenStore()
+        # Previous list of every area, so only new, changed and cancelled entries are matched
+        self.snapshots = SnapshotStore()
+        # Areas diffed since startup; the snapshot file may be shared with other services, so the first list
+        # of every area is matched in full and SeenStore drops what was already sent
+        self.diffed = set()
+        # Areas whose list has not changed since the last cycle are not matched again
+        self.fingerprints = Fingerprints()
+        # Senders run on their own worker threads; the pywhatkit browser is only opened on the first message
+        self.dispatcher = Dispatcher({
+            "email": EmailChannel(),
+            "twilio": TwilioChannel(),
+            "pywhatkit": FunctionChannel(send_pywhatkit),
+        })
+        # Reminders before and after every outage window of the interruptions subscribers were told about
+        self.reminders = ReminderScheduler(self.dispatcher)
+
+    def reload_subscribers(self):
+        # Returns True when the table was (re)loaded
+        mtime = os.path.getmtime(self.subscribers_file)
+        if mtime == self.subscribers_mtime:
+            return False
+        subscribers = load_subscribers(self.subscribers_file)
+        self.matchers = build_matchers(subscribers)
+        self.subscribers_mtime = mtime
+        # New targets have to be matched against the current lists too
+        self.fingerprints.reset()
+        print(f"Loaded {len(subscribers)} subscribers in {len(self.matchers)} areas.")
+        return True
+
+    def fetch(self, areas):
+        # Rows of the areas whose interruption list changed since the previous cycle
+        return self.backend.read_many(areas, self.fingerprints)
+
+    def match(self, events):
+        # Yield (subscriber, event, listed) for every event a subscriber's target occurs in; listed is False
+        # when the target only occurs in the earlier version of the entry
+        for event in events:
+            matcher = self.matchers.get(event.area)
+            if matcher is None:
+                continue
+            listed = set(matcher.find(event.text)) if event.text is not None else set()
+            earlier = set(matcher.find(event.old_text)) if event.old_text is not None else set()
+            for subscriber in listed:
+                yield subscriber, event, True
+            for subscriber in earlier - listed:
+                yield subscriber, event, False
+
+    def run_cycle(self):
+        # Returns the rows of the changed areas, or None when no subscribed area changed
+        reloaded = self.reload_subscribers()
+        self.seen.purge_expired()
+        rows_by_area = self.fetch(set(self.matchers))
+        queued = self.process(rows_by_area, everything=reloaded)
+        print(f"Cycle done: {len(rows_by_area)} changed areas, {sum(len(rows) for rows in rows_by_area.values())} interruptions, "
+              f"{queued} notifications queued.")
+        return [row for rows in rows_by_area.values() for row in rows] if rows_by_area else None
+
+    def process(self, rows_by_area, everything=False):
+        # Diff freshly read lists against the previous ones, match the new, changed and cancelled entries
+        # against every subscriber and queue the notices; returns how many. everything also matches the
+        # entries that did not change, for subscribers added since they were first read; the first list of
+        # an area after startup always is
+        events = []
+        for area, rows in rows_by_area.items():
+            events.extend(self.snapshots.diff(area, rows, everything or area not in self.diffed))
+        messages = []
+        notices = []
+        for subscriber, event, listed in self.match(events):
+            kind = notice_kind(event, self.seen, f"{subscriber.channel}:{subscriber.recipient}", listed)
+            if kind is not None:
+                messages.append(alert_message(subscriber, kind, event))
+                notices.append((kind, event, subscriber.channel, subscriber.recipient, subscriber.target))
+        if messages:
+            self.dispatcher.enqueue_many(messages)
+        self.reminders.follow_many(notices)
+        self.seen.flush()
+        # Only now, so a crash before the notices were queued diffs the same lists again
+        self.snapshots.flush()
+        self.diffed.update(rows_by_area)
+        return len(messages)
+
+    def start(self):
+        self.backend.prepare()
+        self.dispatcher.start()
+        self.reminders.start()
+
+    def close(self):
+        self.reminders.stop()
+        self.dispatcher.stop()
+        self.seen.close()
+        self.snapshots.close()
+        self.backend.close()
+
+@profiled
+def job(service):
+    try:
+        with CHECK_SECONDS.time(backend=service.backend.name):
+            rows = service.run_cycle()
+    except Exception as e:
+        print(f"Fan-out cycle failed: {e}")
+        CHECKS.inc(result="failed")
+        return None
+    CHECKS.inc(result="unchanged" if rows is None else "changed")
+    return rows
+
+if __name__ == "__main__":
+    service = FanoutService()
+
+    # /metrics endpoint (METRICS_PORT) and SIGUSR1 / trigger file for profiling one cycle
+    start_metrics_server()
+    install_profile_signal()
+
+    service.start()
+    print("Service started...")
+
+    try:
+        if POLL_MODE == "adaptive":
+            # Check more often around the usual publication hours and back off while the page is quiet
+            run_adaptive(job, service)
+        else:
+            schedule.every(CHECK_INTERVAL_MINUTES).minutes.do(job, service)
+            job(service)
+            while True:
+                schedule.run_pending()
+                # Sleep until the next cycle is due instead of waking up every second
+                time.sleep(max(schedule.idle_seconds() or 0, 1))
+    finally:
+        service.close()
@@ -0,0 +1,251 @@
+from html.parser import HTMLParser
+import argparse
+import csv
+import html
+import json
+import os
+import time
+from urllib.parse import quote
+
+# PAGE_URL points the scripts at another copy of the page, e.g. the local one served by erpsever_bench.py
+URL = os.getenv("PAGE_URL", 'https://www.energo-pro.bg/bg/planirani-prekysvanija')
+
+# Areas served by Electrodistribution North AD, used when the area list cannot be read from the page
+AREAS = ["Варна", "Велико Търново", "Габрово", "Добрич", "Разград", "Русе", "Силистра", "Търговище", "Шумен"]
+
+# Endpoint the div.map-interruptions widget loads an area from; {area} is replaced with the area name.
+# It may return an HTML fragment, a full page or JSON, all three are understood by parse_response().
+AREA_DATA_URL = os.getenv("AREA_DATA_URL", URL + "?area={area}")
+REQUEST_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+
+# Recorded fixtures: "record" saves every response, "replay" serves them without touching the network
+FIXTURE_MODE = os.getenv("HTTP_FIXTURE_MODE", "off")
+FIXTURE_DIR = os.getenv("HTTP_FIXTURE_DIR", "fixtures")
+
+INTERRUPTION_KIND = "for_next_48_hours"
+
+class InterruptionListParser(HTMLParser):
+    # Collects div.period / div.text of every li[data-interruption] and the div.areas > div.item names
+
+    def __init__(self, kind=INTERRUPTION_KIND):
+        super().__init__(convert_charrefs=True)
+        self.kind = kind
+        self.interruptions = []
+        self.areas = []
+        # Whether an interruption list (ul#interruption_areas or its items) was in the markup at all
+        self.has_list = False
+        self._depth = 0
+        self._li_depth = None
+        self._field = None
+        self._field_depth = None
+        self._current = None
+        self._in_areas_depth = None
+        self._area_name = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("br", "img", "input", "meta", "link", "hr"):
+            if tag == "br" and self._field is not None:
+                self._current[self._field].append("\n")
+            return
+        self._depth += 1
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if (tag == "ul" and attrs.get("id") == "interruption_areas") or "data-interruption" in attrs:
+            self.has_list = True
+        if tag == "li" and attrs.get("data-interruption") == self.kind and self._li_depth is None:
+            self._li_depth = self._depth
+            self._current = {"period": [], "text": []}
+        elif self._li_depth is not None and tag == "div" and self._field is None:
+            for field in ("period", "text"):
+                if field in classes:
+                    self._field = field
+                    self._field_depth = self._depth
+        elif self._field is not None and tag in ("p", "div"):
+            self._current[self._field].append("\n")
+        if tag == "div" and "areas" in classes and self._in_areas_depth is None:
+            self._in_areas_depth = self._depth
+        elif self._in_areas_depth is not None and tag == "strong":
+            self._area_name = []
+
+    def handle_endtag(self, tag):
+        if tag in ("br", "img", "input", "meta", "link", "hr"):
+            return
+        if tag == "strong" and self._area_name is not None:
+            self.areas.append(" ".join("".join(self._area_name).split()))
+            self._area_name = None
+        if self._field is not None and self._depth == self._field_depth:
+            self._field = None
+            self._field_depth = None
+        if self._li_depth is not None and self._depth == self._li_depth:
+            self.interruptions.append((clean_text(self._current["period"]), clean_text(self._current["text"])))
+            self._li_depth = None
+            self._current = None
+        if self._in_areas_depth is not None and self._depth == self._in_areas_depth:
+            self._in_areas_depth = None
+        self._depth -= 1
+
+    def handle_data(self, data):
+        if self._field is not None:
+            self._current[self._field].append(data)
+        if self._area_name is not None:
+            self._area_name.append(data)
+
+def clean_text(parts):
+    # Match what Selenium's .text returns: collapsed spaces, one line per block, no blank lines
+    lines = "".join(parts).split("\n")
+    return "\n".join(" ".join(line.split()) for line in lines if line.strip())
+
+def parse_html(markup, kind=INTERRUPTION_KIND):
+    parser = InterruptionListParser(kind)
+    parser.feed(markup)
+    parser.close()
+    return parser
+
+def list_interruptions(markup):
+    # An area without interruptions still has an (empty) list; a response without one is not area data
+    parser = parse_html(markup)
+    if not parser.has_list:
+        raise ValueError("No interruption list in the response, check AREA_DATA_URL")
+    if parser.areas and not parser.interruptions:
+        # The landing page itself, whose list is only filled in by the page's scripts
+        raise ValueError("Got the page with an unfilled interruption list instead of the area data, check AREA_DATA_URL")
+    return parser.interruptions
+
+def parse_response(body, content_type=""):
+    # Return (period, text) pairs from an HTML page/fragment or a JSON payload; raises ValueError
+    # when the response does not contain an interruption list, so it is not mistaken for an empty one
+    stripped = body.lstrip()
+    if "json" in content_type or stripped.startswith(("{", "[")):
+        payload = json.loads(body)
+        if isinstance(payload, dict):
+            for key in ("html", "content", "data"):
+                if isinstance(payload.get(key), str):
+                    return list_interruptions(payload[key])
+            for key in ("data", "interruptions"):
+                if isinstance(payload.get(key), list):
+                    payload = payload[key]
+                    break
+            else:
+                raise ValueError(f"No interruption list in the JSON response (keys: {', '.join(payload)})")
+        return [(clean_text([item.get("period", "")]), clean_text([item.get("text", "")])) for item in payload]
+    return list_interruptions(body)
+
+def fixture_path(area, extension="html"):
+    return os.path.join(FIXTURE_DIR, f"{area.replace(' ', '_')}.{extension}")
+
+def get_session():
+    if FIXTURE_MODE == "replay":
+        return None  # Replay never touches the network
+
+    import requests
+
+    session = requests.Session()
+    session.headers["User-Agent"] = "Mozilla/5.0 (X11; Linux x86_64) erpsever-alert"
+    return session
+
+def fetch(session, url, fixture_name, fingerprints=None):
+    # Return (body, content_type) for url, honouring the recorded-fixture mode. With fingerprints
+    # the request is conditional and (None, None) means the server answered 304 Not Modified
+    if FIXTURE_MODE == "replay":
+        for extension, content_type in (("html", "text/html"), ("json", "application/json")):
+            path = fixture_path(fixture_name, extension)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as file:
+                    return file.read(), content_type
+        raise FileNotFoundError(f"No recorded fixture for {fixture_name} in {FIXTURE_DIR}")
+
+    headers = fingerprints.request_headers(url) if fingerprints is not None else None
+    response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304:
+        return None, None
+    response.raise_for_status()
+    if fingerprints is not None:
+        fingerprints.remember(url, response.headers)
+    response.encoding = response.encoding or 'utf-8'
+    content_type = response.headers.get("Content-Type", "")
+
+    if FIXTURE_MODE == "record":
+        os.makedirs(FIXTURE_DIR, exist_ok=True)
+        extension = "json" if "json" in content_type else "html"
+        with open(fixture_path(fixture_name, extension), 'w', encoding='utf-8') as file:
+            file.write(response.text)
+    return response.text, content_type
+
+def fetch_areas(session):
+    # Read the area names from the page sidebar, falling back to the known list
+    try:
+        body, _ = fetch(session, URL, "_index")
+        areas = parse_html(body).areas
+        if areas:
+            return areas
+    except Exception as e:
+        print(f"Failed to read the area list, using the defaults: {e}")
+    return list(AREAS)
+
+def read_area(session, area, fingerprints=None):
+    # The [area, period, text] rows of area; raises when the list cannot be read.
+    # With fingerprints (erpsever_poll.Fingerprints) None is returned when the area has not changed
+    url = AREA_DATA_URL.format(area=quote(area))
+    body, content_type = fetch(session, url, area, fingerprints)
+    if fingerprints is not None and (body is None or not fingerprints.changed(("body", area), body)):
+        return None
+    return [[area, period, text] for period, text in parse_response(body, content_type)]
+
+def extract_interruption_data(session, area, fingerprints=None):
+    # Same as read_area(), but a failed read is logged and gives an empty list
+    try:
+        return read_area(session, area, fingerprints)
+    except Exception as e:
+        print(f"Failed to extract interruption data for area {area}: {e}")
+        return []
+
+def render_area_html(rows):
+    # Markup in the same shape as the live ul#interruption_areas list
+    items = []
+    for period, text in rows:
+        text_html = "<br>".join(html.escape(line) for line in text.split("\n"))
+        items.append(
+            f'<li data-interruption="{INTERRUPTION_KIND}">'
+            f'<div class="period">{html.escape(period)}</div>'
+            f'<div class="text">{text_html}</div></li>'
+        )
+    return '<div class="interruption-data"><ul id="interruption_areas">' + "".join(items) + '</ul></div>'
+
+def build_fixtures(csv_path, fixture_dir):
+    # Turn an Area,Period,Text CSV into replayable per-area fixtures
+    by_area = {}
+    with open(csv_path, newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            by_area.setdefault(row['Area'], []).append((row['Period'], row['Text']))
+
+    os.makedirs(fixture_dir, exist_ok=True)
+    for area, rows in by_area.items():
+        with open(os.path.join(fixture_dir, f"{area.replace(' ', '_')}.html"), 'w', encoding='utf-8') as file:
+            file.write(render_area_html(rows))
+
+    sidebar = "".join(f'<div class="item"><strong>{html.escape(area)}</strong></div>' for area in by_area)
+    with open(os.path.join(fixture_dir, "_index.html"), 'w', encoding='utf-8') as file:
+        file.write(f'<div class="map-interruptions"><div class="sidebar"><div class="areas">{sidebar}</div></div></div>')
+    print(f"Wrote fixtures for {len(by_area)} areas to {fixture_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch planned interruptions over plain HTTP")
+    parser.add_argument("areas", nargs="*", help="Areas to fetch (default: every area)")
+    parser.add_argument("--build-fixtures", metavar="CSV", help="Build replay fixtures from an Area,Period,Text CSV")
+    args = parser.parse_args()
+
+    if args.build_fixtures:
+        build_fixtures(args.build_fixtures, FIXTURE_DIR)
+        return
+
+    session = get_session()
+    for area in args.areas or fetch_areas(session):
+        started = time.perf_counter()
+        rows = extract_interruption_data(session, area)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{area}: {len(rows)} interruptions in {elapsed:.1f} ms")
+        for _, period, text in rows:
+            print(f"  Period: {period}\n  Details: {text}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+from collections import deque
+import os
+import re
+
+# Typos tolerated per word of a target typed in Latin letters: 1 for words of FUZZY_MIN_LENGTH letters or
+# more, 2 from twice that. Targets typed in Cyrillic are spelled as in the notices and matched exactly;
+# one letter is often all that tells real places apart there ("Чая" / "Чайка", "Петров" / "Петков")
+MAX_EDIT_DISTANCE = int(os.getenv("MATCH_MAX_DISTANCE", "1"))
+FUZZY_MIN_LENGTH = 6
+CYRILLIC_RE = re.compile(r"[\u0400-\u04ff]")
+
+# Bulgarian streamlined transliteration; texts and targets are both compared in this Latin form,
+# so "Батово", "batovo" and "Batovo" are the same target
+TRANSLITERATION = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z", "и": "i", "й": "y",
+    "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "h", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sht", "ъ": "a", "ь": "y", "ю": "yu",
+    "я": "ya", "ѝ": "i", "ё": "yo", "э": "e", "ы": "y",
+})
+# Everything from the "Публикувано на ..." footer on, also when it is glued to the last word
+PUBLISHED_SUFFIX_RE = re.compile(r"публикувано на.*", re.DOTALL | re.IGNORECASE)
+# Settlement, quarter and street prefixes ("с.", "гр.", "кв.", "ж.к.", "ул.", "бул.", "общ."), after transliteration
+ABBREVIATION_RE = re.compile(r"(?<![a-z0-9])(?:s|gr|kv|zh\.\s*k|ul|bul|obsht)\.|(?<![a-z0-9])(?:selo|grad|kvartal)(?![a-z0-9])")
+NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+def normalize_text(text):
+    # "гр. Генерал-Тошево, ул.„Пирин“Публикувано на ..." -> " general toshevo pirin "
+    text = PUBLISHED_SUFFIX_RE.sub(" ", text).casefold().translate(TRANSLITERATION)
+    text = ABBREVIATION_RE.sub(" ", text)
+    words = NON_WORD_RE.sub(" ", text).split()
+    return " " + " ".join(words) + " " if words else ""
+
+def allowed_distance(word, max_distance=MAX_EDIT_DISTANCE):
+    if len(word) >= 2 * FUZZY_MIN_LENGTH:
+        return min(2, max_distance)
+    if len(word) >= FUZZY_MIN_LENGTH:
+        return min(1, max_distance)
+    return 0
+
+def deletions(word, distance):
+    # word and every string obtained from it by deleting up to distance characters
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {variant[:position] + variant[position + 1:] for variant in frontier for position in range(len(variant))}
+        variants |= frontier
+    return variants
+
+def edit_distance(first, second, limit):
+    # Levenshtein distance, or limit + 1 as soon as it is known to exceed limit
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for row, char in enumerate(first, 1):
+        current = [row]
+        for column, other in enumerate(second, 1):
+            current.append(min(previous[column] + 1, current[column - 1] + 1, previous[column - 1] + (char != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class Automaton:
+    # Aho-Corasick automaton: finds every registered string in a text in one pass,
+    # so the cost per interruption does not grow with the number of subscribers
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.built = False
+
+    def add(self, pattern):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(pattern)
+        self.built = False
+
+    def build(self):
+        # Breadth-first pass that fills in the failure links and merges outputs along them
+        queue = deque()
+        for state in self.goto[0].values():
+            self.fail[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+        self.built = True
+
+    def search(self, text):
+        # Return the set of registered strings that occur in text
+        if not self.built:
+            self.build()
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                found.update(self.output[state])
+        return found
+
+class TargetMatcher:
+    # Subscriber targets matched as whole words against normalized, transliterated text: exact
+    # occurrences through one Aho-Corasick automaton, near misses through a deletion index of the
+    # targets' first words, so neither pass grows with the number of subscribers
+
+    def __init__(self, max_distance=MAX_EDIT_DISTANCE):
+        self.max_distance = max_distance
+        self.automaton = Automaton()
+        self.values = {}
+        # Values of the targets typed in Latin letters, the only ones near misses are reported for
+        self.fuzzy_values = {}
+        # Deletion variant -> the key of the one target whose first word has it, or a tuple of keys when
+        # several share it; most variants belong to a single target, and a set each would cost ~200 bytes
+        self.first_words = {}
+        self.built = False
+
+    def add(self, pattern, value):
+        # Register value under pattern; several values may share the same (normalized) pattern
+        key = normalize_text(pattern)
+        if not key:
+            return
+        if key in self.values:
+            self.values[key].append(value)
+        else:
+            self.values[key] = [value]
+            self.automaton.add(key)
+            self.built = False
+        if self.max_distance <= 0 or CYRILLIC_RE.search(pattern):
+            return
+        if key in self.fuzzy_values:
+            self.fuzzy_values[key].append(value)
+        else:
+            self.fuzzy_values[key] = [value]
+            first = key.split()[0]
+            for variant in deletions(first, allowed_distance(first, self.max_distance)):
+                keys = self.first_words.get(variant)
+                if keys is None:
+                    self.first_words[variant] = key
+                elif isinstance(keys, str):
+                    self.first_words[variant] = [keys, key]
+                elif isinstance(keys, list):
+                    keys.append(key)
+                else:
+                    self.first_words[variant] = list(keys) + [key]
+
+    def build(self):
+        self.automaton.build()
+        # Shared variants are collected in lists while targets are added and kept as tuples
+        for variant, keys in self.first_words.items():
+            if isinstance(keys, list):
+                self.first_words[variant] = tuple(keys)
+        self.built = True
+
+    def fuzzy_patterns(self, words, found):
+        # Targets whose words are each within their allowed distance of consecutive words of the text
+        for position, word in enumerate(words):
+            candidates = set()
+            for variant in deletions(word, allowed_distance(word, self.max_distance)):
+                keys = self.first_words.get(variant)
+                if keys is None:
+                    continue
+                if isinstance(keys, str):
+                    candidates.add(keys)
+                else:
+                    candidates.update(keys)
+            for key in candidates - found:
+                target_words = key.split()
+                text_words = words[position:position + len(target_words)]
+                if len(text_words) == len(target_words) and all(
+                        edit_distance(text_word, target_word, allowed_distance(target_word, self.max_distance))
+                        <= allowed_distance(target_word, self.max_distance)
+                        for text_word, target_word in zip(text_words, target_words)):
+                    found.add(key)
+
+    def find_patterns(self, text):
+        # Return the sets of normalized patterns that occur in text exactly and, for Latin targets, nearly
+        if not self.built:
+            self.build()
+        normalized = normalize_text(text)
+        found = self.automaton.search(normalized)
+        near = set()
+        if self.first_words:
+            near = set(found)
+            self.fuzzy_patterns(normalized.split(), near)
+            near -= found
+        return found, near
+
+    def find(self, text):
+        # Return every value whose pattern occurs in text
+        found, near = self.find_patterns(text)
+        matches = []
+        for pattern in found:
+            matches.extend(self.values[pattern])
+        for pattern in near:
+            matches.extend(self.fuzzy_values[pattern])
+        return matches
+
+    def __len__(self):
+        return len(self.values)
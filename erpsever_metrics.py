@@ -0,0 +1,203 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cProfile
+import functools
+import io
+import os
+import pstats
+import signal
+import threading
+import time
+
+# Port of the /metrics endpoint; the endpoint is not started when this is empty
+METRICS_PORT = os.getenv("METRICS_PORT", "")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Creating this file (or sending SIGUSR1) profiles the next check cycle; the file is removed again
+PROFILE_TRIGGER_FILE = os.getenv("PROFILE_TRIGGER_FILE", "profile_next_cycle")
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            counts, total = self.series.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[position] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self.series[key] = (counts, total + seconds)
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total!r}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class _Timer:
+    # Context manager and decorator that observes the elapsed time into a histogram
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+        return timed
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+BROWSER_STARTS = registry.counter("erpsever_browser_starts_total", "Chrome sessions started")
+BROWSER_RESTARTS = registry.counter("erpsever_browser_restarts_total", "Chrome sessions restarted after a failed health check")
+BROWSER_START_SECONDS = registry.histogram("erpsever_browser_start_seconds", "Time to start Chrome in setup_driver()")
+BROWSER_RECEIVED_BYTES = registry.counter("erpsever_browser_received_bytes_total", "Bytes Chrome received in measured checks (BROWSER_MEASURE=1)", ["profile"])
+CHECK_SECONDS = registry.histogram("erpsever_check_seconds", "Duration of one interruption check", ["backend"])
+CHECKS = registry.counter("erpsever_checks_total", "Interruption checks by result (changed, unchanged, failed)", ["result"])
+PHASE_SECONDS = registry.histogram("erpsever_phase_seconds", "Duration of each phase of a Selenium check", ["phase"])
+ELEMENT_WAIT_SECONDS = registry.histogram("erpsever_element_wait_seconds", "Wait for page elements in check_element_presence()", ["element"])
+WAIT_ATTEMPTS = registry.counter("erpsever_wait_attempts_total", "Page waits by phase and outcome (ok, timeout)", ["phase", "outcome"])
+SEND_SECONDS = registry.histogram("erpsever_send_seconds", "Duration of one send call or batch", ["channel"])
+NOTIFICATIONS = registry.counter("erpsever_notifications_total", "Notifications handled by channel and outcome (sent, failed)", ["channel", "outcome"])
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    # Serve /metrics from a daemon thread; does nothing when no port is configured
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_port}/metrics")
+    return server
+
+_profile_requested = threading.Event()
+
+def install_profile_signal():
+    # SIGUSR1 asks for the next cycle to be profiled; must be called from the main thread
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: _profile_requested.set())
+
+def profile_requested():
+    if os.path.exists(PROFILE_TRIGGER_FILE):
+        try:
+            os.remove(PROFILE_TRIGGER_FILE)
+        except OSError:
+            pass
+        return True
+    if _profile_requested.is_set():
+        _profile_requested.clear()
+        return True
+    return False
+
+def profiled(func):
+    # Run func normally, or under cProfile when a profile of the next cycle was requested
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not profile_requested():
+            return func(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            path = os.path.join(PROFILE_DIR, f"cycle-{time.strftime('%Y%m%dT%H%M%S')}.prof")
+            profiler.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+            print(f"Profiled {func.__name__}, full profile in {path}\n{summary.getvalue()}")
+    return wrapper
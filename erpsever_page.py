@@ -0,0 +1,37 @@
+from erpsever_http import INTERRUPTION_KIND
+
+# Selectors and readers for the interruption page, shared by every Selenium path. Selenium is
+# imported inside the functions, so importing this module does not load it.
+
+AREAS_SELECTOR = 'div.map-interruptions > div.sidebar > div.areas'
+AREA_ITEMS_SELECTOR = AREAS_SELECTOR + ' > div.item'
+LIST_SELECTOR = 'ul#interruption_areas'
+INTERRUPTIONS_SELECTOR = f'{LIST_SELECTOR} li[data-interruption="{INTERRUPTION_KIND}"]'
+
+def area_items(driver):
+    # Area name -> sidebar item of every area on the page
+    from selenium.webdriver.common.by import By
+
+    return {item.find_element(By.TAG_NAME, 'strong').text.strip(): item
+            for item in driver.find_elements(By.CSS_SELECTOR, AREA_ITEMS_SELECTOR)}
+
+def list_html(driver):
+    from selenium.webdriver.common.by import By
+
+    lists = driver.find_elements(By.CSS_SELECTOR, LIST_SELECTOR)
+    return lists[0].get_attribute('innerHTML') if lists else None
+
+def read_interruption_rows(driver, area):
+    # [area, period, text] of every entry of the list currently shown
+    from selenium.webdriver.common.by import By
+
+    rows = []
+    for interruption in driver.find_elements(By.CSS_SELECTOR, INTERRUPTIONS_SELECTOR):
+        try:
+            period = interruption.find_element(By.CSS_SELECTOR, 'div.period').text.strip()
+            text = interruption.find_element(By.CSS_SELECTOR, 'div.text').text.strip()
+        except Exception as e:
+            print(f"Failed to retrieve interruption details: {e}")
+            continue
+        rows.append([area, period, text])
+    return rows
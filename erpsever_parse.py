@@ -0,0 +1,212 @@
+from bisect import bisect_right
+from datetime import date, datetime, time as dtime, timedelta
+import argparse
+import csv
+import re
+import time
+
+DATE_RE = re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4})")
+WINDOW_RE = re.compile(r"(\d{1,2}):(\d{2})\s*ч?\.?\s*до\s*(\d{1,2}):(\d{2})")
+PUBLISHED_RE = re.compile(r"Публикувано на\s*(\d{1,2})\.(\d{1,2})\.(\d{4})\s+(\d{1,2}):(\d{2})")
+LOCATIONS_RE = re.compile(r"в районите на:?\s*(.*?)(?:Публикувано на|$)", re.DOTALL)
+SETTLEMENT_RE = re.compile(r"(?:\b[сС]\.|\bгр\.|\b[сС]ело\b|\b[гГ]рад\b)\s*([А-Я][а-я\-]+(?:\s+[А-Я][а-я\-]+)?)")
+STREET_RE = re.compile(r"(?:\bул\.|\bбул\.)\s*[„\"“]?\s*([0-9А-Яа-я][0-9А-Яа-я\-\. ]*?)\s*(?=[“”\",;–]|\s№|\sот\s|\sи\s|\s\d|$)")
+QUOTED_STREETS_RE = re.compile(r"улиц(?:и|ите)\s*:\s*((?:[„\"“][^„\"“”]+[“”\"][,\s]*)+)")
+QUOTED_RE = re.compile(r"[„\"“]([^„\"“”]+)[“”\"]")
+CUSTOMER_RE = re.compile(r"(?:\b(?:ЕТ|ЗК)\s+[^,;]+|[^,;:]*?\b(?:ЕООД|ООД|ЕАД|АД|СД|КД)\b)")
+TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+
+def parse_period(period):
+    # "от 05.08.2024 г. до 09.08.2024 г. В периода 08:30 ч. до 17:00 ч." ->
+    # (date(2024, 8, 5), date(2024, 8, 9), [(time(8, 30), time(17, 0))])
+    dates = [date(int(y), int(m), int(d)) for d, m, y in DATE_RE.findall(period)]
+    windows = [(dtime(int(h1), int(m1)), dtime(int(h2), int(m2))) for h1, m1, h2, m2 in WINDOW_RE.findall(period)]
+    start = dates[0] if dates else None
+    end = dates[-1] if dates else None
+    return start, end, windows
+
+def parse_published(text):
+    match = PUBLISHED_RE.search(text)
+    if not match:
+        return None
+    day, month, year, hour, minute = (int(part) for part in match.groups())
+    return datetime(year, month, day, hour, minute)
+
+def clean_name(name):
+    return " ".join(name.strip(" .„“”\"'–-").split())
+
+def parse_locations(text):
+    # Split the "в районите на: ..." part into settlements, streets and business customers
+    match = LOCATIONS_RE.search(text)
+    locations = match.group(1) if match else text
+    settlements = unique(clean_name(name) for name in SETTLEMENT_RE.findall(locations))
+    streets = [clean_name(name) for name in STREET_RE.findall(locations)]
+    for quoted in QUOTED_STREETS_RE.findall(locations):
+        streets.extend(clean_name(name) for name in QUOTED_RE.findall(quoted))
+    # Drop lead-ins such as 'фирмите „' in front of the company name
+    customers = [clean_name(re.split(r"[„\"“:]", name)[-1]) for name in CUSTOMER_RE.findall(locations)]
+    return settlements, unique(streets), unique(name for name in customers if name)
+
+def unique(names):
+    seen = set()
+    return tuple(name for name in names if name and not (name in seen or seen.add(name)))
+
+def tokens(value):
+    return TOKEN_RE.findall(value.casefold())
+
+class Interruption:
+    # Compact typed form of one Area,Period,Text row
+    __slots__ = ("area", "period", "text", "start", "end", "windows", "published",
+                 "settlements", "streets", "customers")
+
+    def __init__(self, area, period, text):
+        self.area = area
+        self.period = period
+        self.text = text
+        self.start, self.end, self.windows = parse_period(period)
+        self.published = parse_published(text)
+        self.settlements, self.streets, self.customers = parse_locations(text)
+
+    def intervals(self):
+        # Concrete (start, end) datetimes for every day and daily window of the period
+        if self.start is None:
+            return
+        windows = self.windows or [(dtime(0, 0), dtime(23, 59))]
+        day = self.start
+        while day <= self.end:
+            for window_start, window_end in windows:
+                yield datetime.combine(day, window_start), datetime.combine(day, window_end)
+            day += timedelta(days=1)
+
+    def starts_at(self):
+        if self.start is None:
+            return None
+        return datetime.combine(self.start, min(window[0] for window in self.windows) if self.windows else dtime(0, 0))
+
+    def ends_at(self):
+        if self.end is None:
+            return None
+        return datetime.combine(self.end, max(window[1] for window in self.windows) if self.windows else dtime(23, 59))
+
+    def location_tokens(self):
+        values = (self.area,) + self.settlements + self.streets + self.customers
+        return {token for value in values for token in tokens(value)}
+
+    def __repr__(self):
+        return f"Interruption({self.area!r}, {self.starts_at()} - {self.ends_at()}, {self.settlements})"
+
+class InterruptionIndex:
+    # Inverted index from location token to interruption, plus a start-time order for range queries
+
+    def __init__(self, interruptions=()):
+        self.interruptions = []
+        self.postings = {}
+        self.by_area = {}
+        self._by_start = None
+        for interruption in interruptions:
+            self.add(interruption)
+
+    def add(self, interruption):
+        position = len(self.interruptions)
+        self.interruptions.append(interruption)
+        for token in interruption.location_tokens():
+            self.postings.setdefault(token, set()).add(position)
+        self.by_area.setdefault(interruption.area, []).append(position)
+        self._by_start = None
+        return position
+
+    def lookup(self, query, area=None):
+        # Interruptions whose settlements, streets or customers contain every token of query
+        query_tokens = tokens(query)
+        if not query_tokens:
+            return []
+        postings = sorted((self.postings.get(token, set()) for token in query_tokens), key=len)
+        positions = set(postings[0]).intersection(*postings[1:])
+        if area is not None:
+            positions &= set(self.by_area.get(area, ()))
+        return [self.interruptions[position] for position in sorted(positions)]
+
+    def between(self, start, end, area=None):
+        # Interruptions with at least one daily window overlapping [start, end]
+        if self._by_start is None:
+            timed = [(interruption.starts_at(), position) for position, interruption in enumerate(self.interruptions)
+                     if interruption.start is not None]
+            timed.sort()
+            self._by_start = ([starts_at for starts_at, _ in timed], [position for _, position in timed])
+        starts, positions = self._by_start
+        found = []
+        for position in positions[:bisect_right(starts, end)]:
+            interruption = self.interruptions[position]
+            if area is not None and interruption.area != area:
+                continue
+            if interruption.ends_at() < start:
+                continue
+            if any(window_start <= end and window_end >= start for window_start, window_end in interruption.intervals()):
+                found.append(interruption)
+        return found
+
+def load_csv(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return [Interruption(row['Area'], row['Period'], row['Text']) for row in csv.DictReader(file)]
+
+def benchmark(path, repeat):
+    with open(path, newline='', encoding='utf-8') as file:
+        rows = [(row['Area'], row['Period'], row['Text']) for row in csv.DictReader(file)]
+    rows = rows * repeat
+
+    started = time.perf_counter()
+    interruptions = [Interruption(*row) for row in rows]
+    parse_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = InterruptionIndex(interruptions)
+    index_seconds = time.perf_counter() - started
+
+    queries = [settlement for interruption in interruptions[:len(rows) // repeat] for settlement in interruption.settlements]
+    started = time.perf_counter()
+    for query in queries:
+        index.lookup(query)
+    lookup_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for query in queries:
+        [row for row in rows if query in row[2]]
+    scan_seconds = time.perf_counter() - started
+
+    window_start = min(interruption.starts_at() for interruption in interruptions if interruption.start)
+    started = time.perf_counter()
+    overlapping = index.between(window_start, window_start + timedelta(hours=48))
+    range_seconds = time.perf_counter() - started
+
+    print(f"Rows: {len(rows)} ({repeat}x {path}), queries: {len(queries)}")
+    print(f"Parse: {parse_seconds * 1000:.1f} ms ({parse_seconds / len(rows) * 1e6:.1f} us/row)")
+    print(f"Index build: {index_seconds * 1000:.1f} ms, {len(index.postings)} tokens")
+    print(f"Index lookups: {lookup_seconds / len(queries) * 1e6:.1f} us/query")
+    print(f"Substring scan: {scan_seconds / len(queries) * 1e6:.1f} us/query")
+    print(f"48 h range query: {range_seconds * 1000:.2f} ms, {len(overlapping)} interruptions")
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse interruption rows into typed records and query them")
+    parser.add_argument("csv", nargs="?", default="interruption_data.csv")
+    parser.add_argument("--benchmark", action="store_true", help="Time parsing, indexing and lookups against a plain scan")
+    parser.add_argument("--repeat", type=int, default=100, help="Multiply the rows for the benchmark")
+    parser.add_argument("--lookup", help="Print the interruptions affecting this location")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.csv, args.repeat)
+        return
+
+    index = InterruptionIndex(load_csv(args.csv))
+    if args.lookup:
+        for interruption in index.lookup(args.lookup):
+            print(f"{interruption.area}: {interruption.period}\n  {', '.join(interruption.settlements + interruption.streets)}")
+        return
+    for interruption in index.interruptions:
+        print(interruption)
+        print(f"  streets: {', '.join(interruption.streets)}")
+        print(f"  customers: {', '.join(interruption.customers)}")
+        print(f"  published: {interruption.published}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import csv
+import hashlib
+import os
+import time
+from erpsever_parse import parse_published
+
+# "fixed" keeps each script's own schedule, "adaptive" lets AdaptivePoller choose when to check next
+POLL_MODE = os.getenv("POLL_MODE", "fixed")
+POLL_MIN_SECONDS = float(os.getenv("POLL_MIN_SECONDS", "60"))
+POLL_MAX_SECONDS = float(os.getenv("POLL_MAX_SECONDS", "3600"))
+# Earlier crawl used to learn the publication hours at startup
+POLL_HISTORY_CSV = os.getenv("POLL_HISTORY_CSV", "interruption_data.csv")
+
+# Working hours assumed until enough publications have been observed
+DEFAULT_PUBLICATION_HOURS = range(9, 18)
+DEFAULT_PUBLICATION_DAYS = range(0, 5)
+MIN_OBSERVATIONS = 20
+# An hour (or weekday) is busy when it has at least this share of the busiest one's publications
+BUSY_SHARE = 0.2
+
+def content_hash(value):
+    # sha1 of a response body or of a list of [area, period, text] rows
+    if not isinstance(value, str):
+        value = "\x1e".join("\x1f".join(row) for row in value)
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+class Fingerprints:
+    # Last ETag/Last-Modified and content hash per key, to tell that a payload has not changed
+
+    def __init__(self):
+        self.hashes = {}
+        self.validators = {}
+
+    def changed(self, key, value):
+        # True (and remembered) when value differs from the one seen last time for key
+        digest = content_hash(value)
+        if self.hashes.get(key) == digest:
+            return False
+        self.hashes[key] = digest
+        return True
+
+    def request_headers(self, key):
+        etag, last_modified = self.validators.get(key, (None, None))
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def remember(self, key, headers):
+        self.validators[key] = (headers.get("ETag"), headers.get("Last-Modified"))
+
+    def reset(self):
+        self.hashes.clear()
+        self.validators.clear()
+
+class AdaptivePoller:
+    # Short delays around the hours the operator usually publishes at and right after a change,
+    # doubling delays while the page stays quiet outside them
+
+    def __init__(self, minimum=POLL_MIN_SECONDS, maximum=POLL_MAX_SECONDS):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.hours = Counter()
+        self.days = Counter()
+        self.published = set()
+        self.quiet = 0
+
+    def observe(self, rows):
+        # rows of a changed payload, or None when the check found nothing new
+        if rows is None:
+            self.quiet += 1
+            return
+        self.quiet = 0
+        for area, _, text in rows:
+            published = parse_published(text)
+            if published is None or (area, published) in self.published:
+                continue
+            self.published.add((area, published))
+            self.hours[published.hour] += 1
+            self.days[published.weekday()] += 1
+
+    def seed_csv(self, path=POLL_HISTORY_CSV):
+        if not os.path.exists(path):
+            return
+        with open(path, newline='', encoding='utf-8') as file:
+            self.observe([[row['Area'], row['Period'], row['Text']] for row in csv.DictReader(file)])
+        print(f"Learned publication times from {len(self.published)} interruptions in {path}")
+
+    def busy_at(self, moment):
+        if len(self.published) < MIN_OBSERVATIONS:
+            return moment.weekday() in DEFAULT_PUBLICATION_DAYS and moment.hour in DEFAULT_PUBLICATION_HOURS
+        day_share = self.days[moment.weekday()] / max(self.days.values())
+        hour_share = self.hours[moment.hour] / max(self.hours.values())
+        return day_share >= BUSY_SHARE and hour_share >= BUSY_SHARE
+
+    def next_interval(self, now=None):
+        now = now or datetime.now()
+        # Poll fast inside a busy hour and during the hour leading up to one
+        if self.quiet == 0 or self.busy_at(now) or self.busy_at(now + timedelta(hours=1)):
+            return self.minimum
+        delay = min(self.maximum, self.minimum * 2 ** self.quiet)
+        # ...but never sleep past the start of the next busy stretch
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        for offset in range(1, 24 * 7 + 1):
+            moment = hour + timedelta(hours=offset)
+            if self.busy_at(moment + timedelta(hours=1)):
+                return max(self.minimum, min(delay, (moment - now).total_seconds()))
+        return delay
+
+def run_adaptive(job, *args, poller=None):
+    # Run job forever; it returns the rows it processed, or None when nothing had changed
+    if poller is None:
+        poller = AdaptivePoller()
+        poller.seed_csv()
+    while True:
+        poller.observe(job(*args))
+        delay = poller.next_interval()
+        print(f"Next check in {delay / 60:.1f} min ({poller.quiet} quiet checks in a row)")
+        time.sleep(delay)
@@ -0,0 +1,259 @@
+from datetime import timedelta
+import hashlib
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from erpsever_dispatch import CLAIM_TIMEOUT_SECONDS
+from erpsever_parse import Interruption
+from erpsever_seen import interruption_key
+
+REMINDER_STORE_FILE = os.getenv("REMINDER_STORE_FILE", "reminders.db")
+# Minutes before each outage window a reminder goes out; empty for none
+REMINDER_LEAD_MINUTES = [int(value) for value in os.getenv("REMINDER_LEAD_MINUTES", "1440,60").split(",") if value.strip()]
+# Also send a notice when each window is over
+REMINDER_ON_RESTORE = os.getenv("REMINDER_ON_RESTORE", "1") not in ("", "0")
+# How late (e.g. after a restart) a reminder is still sent; "in 1 h" is wrong soon after, "restored" is not
+LATE_REMINDER_SECONDS = 900
+RESTORE_GRACE_SECONDS = 3600
+# Pause before due reminders are retried after they could not be queued
+RETRY_SECONDS = 60
+
+def lead_label(minutes):
+    if minutes % 60:
+        return f"{minutes} min"
+    return f"{minutes // 60} h"
+
+def window_text(start, end):
+    if start.date() == end.date():
+        return f"{start:%d.%m.%Y} from {start:%H:%M} to {end:%H:%M}"
+    return f"from {start:%d.%m.%Y %H:%M} to {end:%d.%m.%Y %H:%M}"
+
+def plan_reminders(interruption, target, leads=REMINDER_LEAD_MINUTES, on_restore=REMINDER_ON_RESTORE):
+    # (due_at, expires_at, subject, body) for every daily window of interruption: a reminder leads minutes
+    # before each window and a notice when it ends. A reminder that would fall inside the previous
+    # window is left out, so a multi-day outage does not announce tomorrow while today's is still on
+    reminders = []
+    previous_end = None
+    for start, end in interruption.intervals():
+        for minutes in leads:
+            due = start - timedelta(minutes=minutes)
+            if previous_end is not None and due < previous_end:
+                continue
+            reminders.append((due.timestamp(), min(start, due + timedelta(seconds=LATE_REMINDER_SECONDS)).timestamp(),
+                              f"Power interruption in {lead_label(minutes)} for {target}",
+                              f"Reminder: no power {window_text(start, end)}.\nPeriod: {interruption.period}\n"
+                              f"Details: {interruption.text}"))
+        if on_restore:
+            reminders.append((end.timestamp(), end.timestamp() + RESTORE_GRACE_SECONDS,
+                              f"Power restored for {target}",
+                              f"The planned interruption {window_text(start, end)} is over.\nPeriod: {interruption.period}"))
+        previous_end = end
+    return reminders
+
+class ReminderScheduler:
+    # Timer heap of upcoming reminders, persisted in SQLite. One thread sleeps until the earliest
+    # reminder is due and hands it to the dispatcher; scheduling an earlier one wakes it up. The file
+    # may be shared: each service only loads the channels its dispatcher has, and claims a reminder
+    # before queueing it, so one stored by several services goes out once
+
+    def __init__(self, dispatcher, path=REMINDER_STORE_FILE):
+        self.dispatcher = dispatcher
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS reminders (id TEXT PRIMARY KEY, source TEXT, due_at REAL, expires_at REAL, "
+                "channel TEXT, recipient TEXT, subject TEXT, body TEXT, status TEXT DEFAULT 'pending', claimed_at REAL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS reminders_source ON reminders (source)")
+        channels = list(dispatcher.channels)
+        placeholders = ", ".join("?" * len(channels))
+        with self.connection:
+            # Reminders claimed by a service that died before queueing them are handed out again
+            self.connection.execute(
+                f"UPDATE reminders SET status = 'pending' WHERE status = 'sending' AND claimed_at <= ? AND channel IN ({placeholders})",
+                [time.time() - CLAIM_TIMEOUT_SECONDS] + channels,
+            )
+        # id -> (source, due_at, expires_at, channel, recipient, subject, body); the heap holds (due_at, id) and
+        # entries whose id is gone (cancelled) are skipped when they come up
+        self.pending = {row[0]: row[1:] for row in self.connection.execute(
+            "SELECT id, source, due_at, expires_at, channel, recipient, subject, body FROM reminders "
+            f"WHERE status = 'pending' AND channel IN ({placeholders})", channels)}
+        self.heap = [(entry[1], id) for id, entry in self.pending.items()]
+        heapq.heapify(self.heap)
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def schedule_many(self, items):
+        # Queue the reminders of (area, period, text, channel, recipient, target) items in one transaction;
+        # every interruption is parsed and planned once per target, however many recipients it has.
+        # Returns how many reminders were new
+        now = time.time()
+        plans = {}
+        rows = []
+        for area, period, text, channel, recipient, target in items:
+            plan = plans.get((area, period, text, target))
+            if plan is None:
+                plan = plans[area, period, text, target] = [
+                    reminder for reminder in plan_reminders(Interruption(area, period, text), target) if reminder[1] > now]
+            if not plan:
+                continue
+            source = interruption_key(area, period, text, f"{channel}:{recipient}")
+            for due_at, expires_at, subject, body in plan:
+                id = hashlib.sha1(f"{source}\x1f{due_at}\x1f{subject}".encode('utf-8')).hexdigest()
+                rows.append((id, source, due_at, expires_at, channel, recipient, subject, body))
+        with self.lock:
+            rows = [row for row in rows if row[0] not in self.pending]
+            if not rows:
+                return 0
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO reminders (id, source, due_at, expires_at, channel, recipient, subject, body) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            earliest = self.heap[0][0] if self.heap else None
+            for row in rows:
+                self.pending[row[0]] = row[1:]
+                heapq.heappush(self.heap, (row[2], row[0]))
+        if earliest is None or self.heap[0][0] < earliest:
+            self.wakeup.set()
+        return len(rows)
+
+    def schedule(self, area, period, text, channel, recipient, target):
+        # Queue the reminders of one interruption for one recipient; returns how many were new
+        return self.schedule_many([(area, period, text, channel, recipient, target)])
+
+    def cancel_many(self, items):
+        # Drop the reminders of (area, period, text, channel, recipient) items - interruptions that were
+        # cancelled or replaced by a newer version - in one pass and one transaction
+        sources = {interruption_key(area, period, text, f"{channel}:{recipient}")
+                   for area, period, text, channel, recipient in items}
+        if not sources:
+            return 0
+        with self.lock:
+            ids = [id for id, entry in self.pending.items() if entry[0] in sources]
+            for id in ids:
+                del self.pending[id]
+            with self.connection:
+                self.connection.executemany("DELETE FROM reminders WHERE source = ?", [(source,) for source in sources])
+        return len(ids)
+
+    def cancel(self, area, period, text, channel, recipient):
+        return self.cancel_many([(area, period, text, channel, recipient)])
+
+    def follow_many(self, notices):
+        # Keep the reminders in line with (kind, event, channel, recipient, target) notices ("new", "changed"
+        # or "cancelled"), e.g. all notices of one check cycle
+        cancelled = []
+        scheduled = []
+        for kind, event, channel, recipient, target in notices:
+            if kind in ("changed", "cancelled"):
+                cancelled.append((event.area, event.old_period, event.old_text, channel, recipient))
+            if kind in ("new", "changed"):
+                scheduled.append((event.area, event.period, event.text, channel, recipient, target))
+        self.cancel_many(cancelled)
+        self.schedule_many(scheduled)
+
+    def follow(self, kind, event, channel, recipient, target):
+        self.follow_many([(kind, event, channel, recipient, target)])
+
+    def pop_due(self):
+        # Take the reminders that are due off the heap and claim them as (id, entry); late ones whose moment
+        # has passed are dropped. Their rows stay stored until sent() is called
+        now = time.time()
+        due = []
+        stale = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                _, id = heapq.heappop(self.heap)
+                entry = self.pending.pop(id, None)
+                if entry is None:
+                    continue
+                if entry[2] > now:
+                    due.append((id, entry))
+                else:
+                    print(f"Dropping stale reminder to {entry[4]}: {entry[5]}")
+                    stale.append(id)
+            self.delete(stale)
+            return self.claim(due, now)
+
+    def claim(self, due, now):
+        # The reminders of due that no other service sharing the file has claimed, marked as being sent
+        if not due:
+            return []
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            claimed = [(id, entry) for id, entry in due if self.connection.execute(
+                "UPDATE reminders SET status = 'sending', claimed_at = ? WHERE id = ? AND status = 'pending'", (now, id)
+            ).rowcount]
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return claimed
+
+    def release(self, due):
+        # Put claimed reminders that could not be queued back, to be retried
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("UPDATE reminders SET status = 'pending' WHERE id = ?", [(id,) for id, _ in due])
+            for id, entry in due:
+                self.pending[id] = entry
+                heapq.heappush(self.heap, (entry[1], id))
+
+    def delete(self, ids):
+        if ids:
+            with self.connection:
+                self.connection.executemany("DELETE FROM reminders WHERE id = ?", [(id,) for id in ids])
+
+    def sent(self, ids):
+        # The reminders are in the dispatcher's outbox now
+        with self.lock:
+            self.delete(ids)
+
+    def next_due_in(self):
+        with self.lock:
+            # Skip cancelled entries at the top so they do not cause an early wakeup
+            while self.heap and self.heap[0][1] not in self.pending:
+                heapq.heappop(self.heap)
+            return None if not self.heap else max(0.0, self.heap[0][0] - time.time())
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.wakeup.clear()
+            due = []
+            try:
+                due = self.pop_due()
+                if due:
+                    self.dispatcher.enqueue_many([(channel, recipient, body, subject)
+                                                  for _, (_, _, _, channel, recipient, subject, body) in due])
+                    self.sent([id for id, _ in due])
+                    print(f"Queued {len(due)} reminders.")
+            except Exception as e:
+                # The thread keeps running; the reminders are tried again after a pause
+                print(f"Failed to queue reminders: {e}")
+                if due:
+                    try:
+                        self.release(due)
+                    except Exception as e:
+                        print(f"Failed to put reminders back: {e}")
+                self.wakeup.wait(RETRY_SECONDS)
+                continue
+            # Sleep until the next reminder, or until an earlier one is scheduled
+            self.wakeup.wait(self.next_due_in())
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="reminders", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.connection.close()
+
+    def __len__(self):
+        return len(self.pending)
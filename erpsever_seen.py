@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+import hashlib
+import os
+import sqlite3
+import time
+from erpsever_parse import parse_period
+
+SEEN_STORE_FILE = os.getenv("SEEN_STORE_FILE", "seen_interruptions.db")
+# Entries whose period cannot be parsed are kept this long
+DEFAULT_TTL_DAYS = 7
+
+def normalize(value):
+    return " ".join(value.split()).casefold()
+
+def interruption_key(area, period, text, scope=""):
+    # Stable hash of the normalized interruption; scope (e.g. the recipient) keeps subscribers apart
+    raw = "\x1f".join((normalize(scope), normalize(area), normalize(period), normalize(text)))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def period_expiry(period, now=None):
+    # End of the last day of the period, e.g. "от 05.08.2024 г. до 09.08.2024 г. ..." -> 10.08.2024 00:00
+    try:
+        _, end, _ = parse_period(period)
+    except ValueError:
+        end = None
+    if end is not None:
+        return (datetime.combine(end, datetime.min.time()) + timedelta(days=1)).timestamp()
+    return (now or time.time()) + DEFAULT_TTL_DAYS * 86400
+
+class SeenStore:
+    # Seen-interruption store: an in-memory dict for O(1) lookups backed by SQLite for restarts
+
+    def __init__(self, path=SEEN_STORE_FILE):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, area TEXT, expires_at REAL, first_seen REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS seen_expires_at ON seen (expires_at)")
+        self.connection.commit()
+        self.expiry = dict(self.connection.execute("SELECT key, expires_at FROM seen"))
+        self.pending = []
+
+    def is_new(self, area, period, text, scope=""):
+        if period_expiry(period) <= time.time():
+            return False  # Already over, nothing to alert about
+        return interruption_key(area, period, text, scope) not in self.expiry
+
+    def add(self, area, period, text, scope=""):
+        # Remember an interruption; the write is buffered until flush()
+        key = interruption_key(area, period, text, scope)
+        if key in self.expiry:
+            return False
+        expires_at = period_expiry(period)
+        self.expiry[key] = expires_at
+        self.pending.append((key, area, expires_at, time.time()))
+        return True
+
+    def was_sent(self, area, period, text, scope=""):
+        return interruption_key(area, period, text, scope) in self.expiry
+
+    def forget(self, area, period, text, scope=""):
+        # Drop an interruption that was cancelled or replaced, so it is reported again if it comes back
+        key = interruption_key(area, period, text, scope)
+        if self.expiry.pop(key, None) is None:
+            return False
+        self.flush()
+        with self.connection:
+            self.connection.execute("DELETE FROM seen WHERE key = ?", (key,))
+        return True
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO seen VALUES (?, ?, ?, ?)", self.pending)
+        self.pending = []
+
+    def purge_expired(self, now=None):
+        now = now or time.time()
+        self.flush()
+        expired = [key for key, expires_at in self.expiry.items() if expires_at <= now]
+        for key in expired:
+            del self.expiry[key]
+        if expired:
+            with self.connection:
+                self.connection.execute("DELETE FROM seen WHERE expires_at <= ?", (now,))
+        return len(expired)
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __len__(self):
+        return len(self.expiry)
@@ -0,0 +1,191 @@
+from datetime import datetime
+import os
+import re
+import sqlite3
+from erpsever_parse import Interruption
+from erpsever_seen import interruption_key, normalize
+
+SNAPSHOT_STORE_FILE = os.getenv("SNAPSHOT_STORE_FILE", "interruption_snapshots.db")
+# Locations part of the text, used to recognize an entry whose period or wording changed
+LOCATIONS_START_RE = re.compile(r"в районите на:?", re.IGNORECASE)
+IDENTITY_CHARS = 80
+
+class Event:
+    # kind is "new", "changed", "cancelled" or "unchanged" (listed before, matched again for new subscribers);
+    # old_period/old_text are what subscribers were told before, changes describes the difference
+    __slots__ = ("kind", "area", "period", "text", "old_period", "old_text", "changes")
+
+    def __init__(self, kind, area, period=None, text=None, old_period=None, old_text=None, changes=()):
+        self.kind = kind
+        self.area = area
+        self.period = period
+        self.text = text
+        self.old_period = old_period
+        self.old_text = old_text
+        self.changes = list(changes)
+
+    def __repr__(self):
+        return f"Event({self.kind!r}, {self.area!r}, {self.period or self.old_period!r})"
+
+def location_identity(interruption):
+    # First settlement, street or customer, or the start of the locations text
+    for names in (interruption.settlements, interruption.streets, interruption.customers):
+        if names:
+            return normalize(names[0])
+    parts = LOCATIONS_START_RE.split(interruption.text, 1)
+    return normalize(parts[-1])[:IDENTITY_CHARS]
+
+def describe_changes(old, new):
+    # Human readable differences between two versions of one interruption
+    changes = []
+
+    def day(value):
+        return value.strftime("%d.%m.%Y") if value else "?"
+
+    def hours(windows):
+        return ", ".join(f"{start:%H:%M}-{end:%H:%M}" for start, end in windows) or "all day"
+
+    if new.start != old.start:
+        changes.append(f"starts {day(new.start)} instead of {day(old.start)}")
+    if new.end != old.end:
+        verb = "extended to" if old.end and new.end and new.end > old.end else "now ends"
+        changes.append(f"{verb} {day(new.end)} (was {day(old.end)})")
+    if new.windows != old.windows:
+        changes.append(f"hours {hours(new.windows)} instead of {hours(old.windows)}")
+    for label, before, after in (("settlements", old.settlements, new.settlements),
+                                 ("streets", old.streets, new.streets),
+                                 ("customers", old.customers, new.customers)):
+        added = [name for name in after if name not in before]
+        removed = [name for name in before if name not in after]
+        if added:
+            changes.append(f"added {label}: {', '.join(added)}")
+        if removed:
+            changes.append(f"removed {label}: {', '.join(removed)}")
+    return changes or ["details changed"]
+
+class SnapshotStore:
+    # Last interruption list of every area, kept in memory and in SQLite, so each new list is reduced
+    # to the entries that appeared, changed or disappeared - also across restarts
+
+    def __init__(self, path=SNAPSHOT_STORE_FILE):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS snapshot (area TEXT, key TEXT, period TEXT, text TEXT, PRIMARY KEY (area, key))"
+        )
+        self.connection.commit()
+        # area -> {row key: (period, text)}
+        self.areas = {}
+        for area, key, period, text in self.connection.execute("SELECT area, key, period, text FROM snapshot"):
+            self.areas.setdefault(area, {})[key] = (period, text)
+        self.pending = set()
+
+    def diff(self, area, rows, everything=False):
+        # Events for rows (the fresh [area, period, text] list of area) against the previous list; with
+        # everything, entries that did not change come back as "unchanged" events too
+        previous = self.areas.get(area, {})
+        current = {}
+        for _, period, text in rows:
+            current[interruption_key(area, period, text)] = (period, text)
+
+        now = datetime.now()
+        if not current and any(is_upcoming(Interruption(area, *entry), now) for entry in previous.values()):
+            # More likely a failed read than every upcoming interruption being called off at once
+            print(f"Empty interruption list for {area}, keeping the previous one.")
+            return []
+
+        events = []
+        appeared = [(key, entry) for key, entry in current.items() if key not in previous]
+        gone = [(key, entry) for key, entry in previous.items() if key not in current]
+        if everything:
+            events.extend(Event("unchanged", area, *entry) for key, entry in current.items() if key in previous)
+
+        # Pair rewritten entries with their earlier version: first by start date and location, then by
+        # location alone (a moved period); one dict pass each, so the diff stays linear in the row count
+        added = [Interruption(area, *entry) for _, entry in appeared]
+        removed = [Interruption(area, *entry) for _, entry in gone]
+        for identity in (lambda item: (item.start, location_identity(item)), location_identity):
+            candidates = {}
+            for interruption in removed:
+                candidates.setdefault(identity(interruption), []).append(interruption)
+            unpaired = []
+            for interruption in added:
+                earlier = candidates.get(identity(interruption))
+                if not earlier:
+                    unpaired.append(interruption)
+                    continue
+                old = earlier.pop(0)
+                events.append(Event("changed", area, interruption.period, interruption.text,
+                                    old.period, old.text, describe_changes(old, interruption)))
+            added = unpaired
+            removed = [interruption for interruption in removed
+                       if interruption in candidates.get(identity(interruption), ())]
+
+        events.extend(Event("new", area, interruption.period, interruption.text) for interruption in added)
+        # Entries that drop off after their period are over, not cancelled
+        events.extend(Event("cancelled", area, old_period=interruption.period, old_text=interruption.text)
+                      for interruption in removed if is_upcoming(interruption, now))
+
+        if current != previous:
+            self.areas[area] = current
+            self.pending.add(area)
+        return events
+
+    def flush(self):
+        # Write the lists diffed since the last flush, once their notifications have been queued
+        if not self.pending:
+            return
+        with self.connection:
+            for area in self.pending:
+                self.connection.execute("DELETE FROM snapshot WHERE area = ?", (area,))
+                self.connection.executemany(
+                    "INSERT INTO snapshot VALUES (?, ?, ?, ?)",
+                    [(area, key, period, text) for key, (period, text) in self.areas.get(area, {}).items()],
+                )
+        self.pending = set()
+
+    def clear(self):
+        self.areas = {}
+        self.pending = set()
+        with self.connection:
+            self.connection.execute("DELETE FROM snapshot")
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+def is_upcoming(interruption, now):
+    ends_at = interruption.ends_at()
+    return ends_at is None or ends_at > now
+
+def notice_kind(event, seen, scope, listed=True):
+    # Which notice scope (a channel:recipient) gets for event - "new", "changed", "cancelled" or None -
+    # recorded in seen; listed tells whether the target occurs in the current text of the event
+    area = event.area
+    if event.kind == "cancelled" or not listed:
+        # Also a changed entry that no longer lists the target
+        if event.old_text is None or not seen.was_sent(area, event.old_period, event.old_text, scope):
+            return None
+        seen.forget(area, event.old_period, event.old_text, scope)
+        return "cancelled"
+    if not seen.is_new(area, event.period, event.text, scope):
+        return None
+    seen.add(area, event.period, event.text, scope)
+    if event.kind == "changed" and seen.was_sent(area, event.old_period, event.old_text, scope):
+        seen.forget(area, event.old_period, event.old_text, scope)
+        return "changed"
+    return "new"
+
+def notice_text(kind, event):
+    # Body of the notice about event
+    if kind == "cancelled":
+        return f"Cancelled - no longer listed for this location.\nPeriod: {event.old_period}\nDetails: {event.old_text}"
+    body = f"Period: {event.period}\nDetails: {event.text}"
+    if kind == "changed":
+        body = f"Updated: {'; '.join(event.changes)}.\n{body}"
+    return body
+
+NOTICE_SUBJECTS = {
+    "new": "Interruption Alert for {}",
+    "changed": "Interruption Updated for {}",
+    "cancelled": "Interruption Cancelled for {}",
+}
@@ -0,0 +1,240 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+import erpsever_http
+from erpsever_core import BACKENDS, FETCH_BACKEND
+from erpsever_fanout import SUBSCRIBERS_FILE, FanoutService
+from erpsever_metrics import CHECKS, start_metrics_server
+from erpsever_poll import Fingerprints
+
+SUPERVISOR_WORKERS = int(os.getenv("SUPERVISOR_WORKERS", "3"))
+# Default minutes between two reads of one area; AREA_INTERVALS overrides single areas, e.g. "Варна=2,Русе=10"
+AREA_INTERVAL_MINUTES = float(os.getenv("AREA_INTERVAL_MINUTES", "5"))
+AREA_INTERVALS = os.getenv("AREA_INTERVALS", "")
+# A worker stuck in one read for longer than this is killed and restarted
+READ_TIMEOUT_SECONDS = float(os.getenv("READ_TIMEOUT_SECONDS", "180"))
+# A worker that has not reported anything for this long is considered hung
+HEARTBEAT_TIMEOUT_SECONDS = 60
+# Longest an area that keeps hanging or crashing its worker is put aside
+MAX_AREA_BACKOFF_SECONDS = 3600
+REPORT_SECONDS = 300
+# How long a worker gets to close its browser after SIGTERM before it and its browser are killed
+WORKER_STOP_SECONDS = 10
+
+def parse_intervals(areas, default_minutes, overrides):
+    intervals = {area: default_minutes * 60 for area in areas}
+    for entry in filter(None, (part.strip() for part in overrides.split(","))):
+        area, minutes = entry.split("=", 1)
+        intervals[area.strip()] = float(minutes) * 60
+    return intervals
+
+def area_worker(number, areas, intervals, backend_name, results, heartbeats, reading, not_before):
+    # Reads its shard of areas, each on its own schedule, and sends (area, rows, error, seconds, worker)
+    # to the supervisor; rows is None when the list has not changed since the last read
+    # SIGTERM from the supervisor unwinds through the finally below, so the browser is quit too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    backend = BACKENDS[backend_name]()
+    backend.prepare()
+    fingerprints = Fingerprints()
+    due = {area: not_before.get(area, 0) for area in areas}
+    try:
+        while True:
+            heartbeats[number] = time.time()
+            area = min(due, key=due.get)
+            delay = due[area] - time.time()
+            if delay > 0:
+                time.sleep(min(delay, 1))
+                continue
+            reading[number] = areas.index(area) + 1
+            started = time.time()
+            try:
+                rows, error = backend.read(area, fingerprints), None
+            except Exception as e:
+                rows, error = None, str(e)
+            reading[number] = 0
+            results.put((area, rows, error, time.time() - started, number))
+            due[area] = time.time() + intervals[area]
+    finally:
+        backend.close()
+
+def stop_worker(process):
+    # Terminate a worker and wait for it to quit its browser; a worker that does not is killed along with
+    # its chromedriver and Chrome processes (those are found with psutil, when it is installed)
+    try:
+        import psutil
+        children = psutil.Process(process.pid).children(recursive=True)
+    except Exception:
+        psutil, children = None, []
+    process.terminate()
+    process.join(WORKER_STOP_SECONDS)
+    if process.is_alive():
+        process.kill()
+        process.join()
+    for child in children:
+        try:
+            child.kill()
+        except psutil.Error:
+            pass
+
+class Supervisor:
+    # Area monitors in a pool of worker processes, results matched and notified in this process
+
+    def __init__(self, service, areas, workers=SUPERVISOR_WORKERS, backend=FETCH_BACKEND, intervals=None):
+        self.service = service
+        self.areas = list(areas)
+        self.backend = backend
+        self.intervals = intervals or parse_intervals(self.areas, AREA_INTERVAL_MINUTES, AREA_INTERVALS)
+        self.context = multiprocessing.get_context("spawn")
+        self.results = self.context.Queue()
+        count = max(1, min(workers, len(self.areas)))
+        # Round-robin shards, so a slow area shares its worker with as few others as possible
+        self.shards = [self.areas[number::count] for number in range(count)]
+        self.heartbeats = self.context.Array('d', count)
+        self.reading = self.context.Array('i', count)
+        self.processes = [None] * count
+        self.read_started = [None] * count
+        self.last_read = {}
+        self.latest = {}
+        self.failures = {area: 0 for area in self.areas}
+        self.not_before = {}
+        self.restarts = 0
+
+    def start_worker(self, number):
+        shard = self.shards[number]
+        self.heartbeats[number] = time.time()
+        self.reading[number] = 0
+        self.read_started[number] = None
+        process = self.context.Process(
+            target=area_worker, name=f"area-worker-{number}", daemon=True,
+            args=(number, shard, {area: self.intervals[area] for area in shard}, self.backend,
+                  self.results, self.heartbeats, self.reading,
+                  {area: self.not_before[area] for area in shard if area in self.not_before}),
+        )
+        process.start()
+        self.processes[number] = process
+        print(f"Worker {number} (pid {process.pid}) monitors: {', '.join(shard)}")
+
+    def put_aside(self, area):
+        # Back off an area that hung or crashed its worker, so it cannot keep the rest of the shard stale
+        self.failures[area] += 1
+        delay = min(MAX_AREA_BACKOFF_SECONDS, self.intervals[area] * 2 ** (self.failures[area] - 1))
+        self.not_before[area] = time.time() + delay
+        print(f"Area {area} put aside for {delay / 60:.1f} min after {self.failures[area]} failures.")
+
+    def check_workers(self):
+        now = time.time()
+        for number, process in enumerate(self.processes):
+            shard = self.shards[number]
+            reading = self.reading[number]
+            area = shard[reading - 1] if reading else None
+            # Track how long the current read has been running as seen from here
+            if area is None:
+                self.read_started[number] = None
+            elif self.read_started[number] is None or self.read_started[number][0] != area:
+                self.read_started[number] = (area, now)
+
+            reason = None
+            if not process.is_alive():
+                reason = f"exited with code {process.exitcode}"
+            elif area is not None and now - self.read_started[number][1] > READ_TIMEOUT_SECONDS:
+                reason = f"stuck reading {area} for {now - self.read_started[number][1]:.0f} s"
+            elif area is None and now - self.heartbeats[number] > HEARTBEAT_TIMEOUT_SECONDS:
+                reason = f"no heartbeat for {now - self.heartbeats[number]:.0f} s"
+            if reason is None:
+                continue
+
+            print(f"Worker {number} {reason}, restarting it.")
+            if process.is_alive():
+                stop_worker(process)
+            if area is not None:
+                self.put_aside(area)
+            CHECKS.inc(result="failed")
+            self.restarts += 1
+            self.start_worker(number)
+
+    def handle(self, result):
+        area, rows, error, seconds, number = result
+        if error is not None:
+            print(f"Worker {number} failed to read {area} in {seconds:.1f} s: {error}")
+            CHECKS.inc(result="failed")
+            return
+        self.last_read[area] = time.time()
+        self.failures[area] = 0
+        self.not_before.pop(area, None)
+        CHECKS.inc(result="unchanged" if rows is None else "changed")
+        if rows is None:
+            return
+        self.latest[area] = rows
+        # The first list of every area after startup is matched in full by FanoutService.process
+        queued = self.service.process({area: rows})
+        print(f"{area}: {len(rows)} interruptions read in {seconds:.1f} s by worker {number}, {queued} notifications queued.")
+
+    def report(self):
+        now = time.time()
+        ages = []
+        for area in self.areas:
+            read_at = self.last_read.get(area)
+            age = f"{(now - read_at) / 60:.1f} min" if read_at else "never"
+            stale = read_at is None or now - read_at > 2 * self.intervals[area]
+            ages.append(f"{area} {age}{' (stale)' if stale else ''}")
+        print(f"Freshness: {', '.join(ages)}; {self.restarts} worker restarts")
+
+    def run(self):
+        for number in range(len(self.shards)):
+            self.start_worker(number)
+        next_report = time.time() + REPORT_SECONDS
+        try:
+            while True:
+                try:
+                    result = self.results.get(timeout=1)
+                except queue.Empty:
+                    result = None
+                if self.service.reload_subscribers():
+                    # New targets are matched against the lists already read
+                    self.service.process(self.latest, everything=True)
+                self.service.seen.purge_expired()
+                if result is not None:
+                    self.handle(result)
+                self.check_workers()
+                if time.time() >= next_report:
+                    self.report()
+                    next_report = time.time() + REPORT_SECONDS
+        finally:
+            self.stop()
+
+    def stop(self):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                stop_worker(process)
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor every area from a pool of worker processes")
+    parser.add_argument("--workers", type=int, default=SUPERVISOR_WORKERS)
+    parser.add_argument("--backend", choices=("selenium", "http"), default=FETCH_BACKEND)
+    parser.add_argument("--areas", help="Comma-separated areas (default: all areas)")
+    parser.add_argument("--interval", type=float, default=AREA_INTERVAL_MINUTES, help="Default minutes between reads of an area")
+    parser.add_argument("--area-interval", action="append", default=[], metavar="AREA=MINUTES")
+    parser.add_argument("--subscribers", default=SUBSCRIBERS_FILE)
+    args = parser.parse_args()
+
+    areas = [area.strip() for area in args.areas.split(",")] if args.areas else list(erpsever_http.AREAS)
+    overrides = ",".join(filter(None, [AREA_INTERVALS] + args.area_interval))
+    intervals = parse_intervals(areas, args.interval, overrides)
+
+    service = FanoutService(args.subscribers, backend=args.backend)
+    service.reload_subscribers()
+    # /metrics endpoint when METRICS_PORT is set
+    start_metrics_server()
+    service.start()
+    print("Supervisor started...")
+    try:
+        Supervisor(service, areas, args.workers, args.backend, intervals).run()
+    finally:
+        service.close()
+
+if __name__ == "__main__":
+    main()
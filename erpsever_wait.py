@@ -0,0 +1,172 @@
+from collections import deque
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+import time
+from erpsever_metrics import PHASE_SECONDS, WAIT_ATTEMPTS
+from erpsever_page import INTERRUPTIONS_SELECTOR, LIST_SELECTOR
+
+# The list counts as ready once it has not mutated for this long
+QUIET_PERIOD_MS = 400
+# Without any mutation the list of an area clicked again is taken as it is after this long
+UNCHANGED_GRACE_MS = 5000
+
+# Records mutations inside div.interruption-data; the list may be patched in place or replaced
+WATCH_LIST_SCRIPT = """
+if (!window.__erpseverObserver) {
+    window.__erpseverObserver = new MutationObserver(function (mutations) {
+        for (var i = 0; i < mutations.length; i++) {
+            var target = mutations[i].target;
+            var element = target.nodeType === 1 ? target : target.parentElement;
+            if (element && element.closest && element.closest('div.interruption-data, #interruption_areas')) {
+                window.__erpseverMutations += 1;
+                window.__erpseverLastMutation = performance.now();
+                return;
+            }
+        }
+    });
+    window.__erpseverObserver.observe(document.body, {childList: true, subtree: true, characterData: true, attributes: true});
+}
+window.__erpseverMutations = 0;
+window.__erpseverLastMutation = performance.now();
+"""
+
+LIST_STATE_SCRIPT = """
+var list = document.querySelector(arguments[1]);
+return {
+    exists: !!list,
+    items: document.querySelectorAll(arguments[0]).length,
+    mutations: window.__erpseverMutations || 0,
+    quietFor: performance.now() - (window.__erpseverLastMutation || 0),
+    readyState: document.readyState
+};
+"""
+
+# Clicks an area and tells whether it was the last one clicked on this page, i.e. its list is already shown
+CLICK_AREA_SCRIPT = """
+var already = window.__erpseverSelected === arguments[0];
+window.__erpseverSelected = arguments[0];
+arguments[0].click();
+return already;
+"""
+
+class AdaptiveTimeout:
+    # Timeout learned from recent latencies: a multiple of the slowest recent run, within bounds
+
+    def __init__(self, initial, minimum=2.0, maximum=60.0, factor=3.0, history=20):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.latencies = deque(maxlen=history)
+
+    def record(self, seconds):
+        self.latencies.append(seconds)
+
+    def value(self):
+        if not self.latencies:
+            return self.initial
+        return min(self.maximum, max(self.minimum, max(self.latencies) * self.factor))
+
+class PhaseTimer:
+    # Per-phase wall-clock timings of one check cycle
+
+    def __init__(self):
+        self.phases = []
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def report(self):
+        total = sum(seconds for _, seconds in self.phases)
+        details = ", ".join(f"{name} {seconds:.2f} s" for name, seconds in self.phases)
+        print(f"Cycle timings: {details} (total {total:.2f} s)")
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        self.timer.phases.append((self.name, seconds))
+        PHASE_SECONDS.observe(seconds, phase=self.name)
+        return False
+
+# Learned per phase and shared by every cycle of the process
+timeouts = {
+    "page load": AdaptiveTimeout(30),
+    "modal dismissal": AdaptiveTimeout(5, minimum=1),
+    "list ready": AdaptiveTimeout(30),
+}
+
+def wait_with_backoff(driver, condition, phase, attempts=3, backoff=1.0):
+    # Wait for condition with the learned timeout; every retry doubles both the timeout and the pause
+    timeout = timeouts[phase]
+    started = time.perf_counter()
+    for attempt in range(attempts):
+        try:
+            seconds = min(timeout.value() * 2 ** attempt, timeout.maximum)
+            result = WebDriverWait(driver, seconds, poll_frequency=0.1).until(condition)
+            timeout.record(time.perf_counter() - started)
+            WAIT_ATTEMPTS.inc(phase=phase, outcome="ok")
+            return result
+        except TimeoutException as e:
+            WAIT_ATTEMPTS.inc(phase=phase, outcome="timeout")
+            print(f"{phase}: attempt {attempt + 1} timed out: {e.msg or 'no details'}")
+            if attempt + 1 < attempts:
+                time.sleep(backoff * 2 ** attempt)
+    raise TimeoutException(f"{phase} did not complete after {attempts} attempts")
+
+def ready_states(driver):
+    # document.readyState values that count as loaded; with the "eager" page load strategy of the lean
+    # browser profile the parsed DOM is enough
+    return ("interactive", "complete") if driver.capabilities.get("pageLoadStrategy") == "eager" else ("complete",)
+
+def wait_for_page(driver):
+    # The map widget is rendered and the document has finished loading
+    loaded = ready_states(driver)
+
+    def ready(driver):
+        if driver.execute_script("return document.readyState") not in loaded:
+            return False
+        return driver.find_elements(By.CSS_SELECTOR, 'div.map-interruptions div.item') or False
+    return wait_with_backoff(driver, ready, "page load")
+
+def dismiss_modal(driver):
+    try:
+        modal_overlay = driver.find_element(By.CSS_SELECTOR, 'div.modal-overlay')
+    except Exception:
+        return False
+    if not modal_overlay.is_displayed():
+        return False
+    print("Modal overlay detected. Attempting to close.")
+    driver.execute_script("arguments[0].click();", modal_overlay)
+    try:
+        wait_with_backoff(driver, EC.invisibility_of_element(modal_overlay), "modal dismissal", attempts=1)
+    except TimeoutException as e:
+        print(f"Modal overlay is still visible: {e.msg}")
+    return True
+
+def click_and_wait_for_list(driver, item):
+    # Click an area and wait until ul#interruption_areas has been updated and stays quiet; raises
+    # TimeoutException when it is not, so a slow area is never read with the previous area's list
+    driver.execute_script(WATCH_LIST_SCRIPT)
+    already_selected = driver.execute_script(CLICK_AREA_SCRIPT, item)
+    loaded = ready_states(driver)
+
+    def settled(driver):
+        state = driver.execute_script(LIST_STATE_SCRIPT, INTERRUPTIONS_SELECTOR, LIST_SELECTOR)
+        if state["readyState"] not in loaded or not state["exists"] or state["quietFor"] < QUIET_PERIOD_MS:
+            return False
+        if state["mutations"]:
+            return state
+        # No redraw at all is only fine when the list was already showing this area
+        return state if already_selected and state["quietFor"] >= UNCHANGED_GRACE_MS else False
+
+    return wait_with_backoff(driver, settled, "list ready")